@@ -1,4 +1,4 @@
-from sys import stdin, stdout
+from sys import stdin, stdout, implementation
 from re import match
 from select import poll, POLLIN
 
@@ -12,19 +12,105 @@ References:
 """
 
 
+def _asyncio():
+    """
+    Import asyncio only when a key is awaited, so programs that never use
+    agetch() don't pay for it in RAM.
+    """
+    try:
+        import uasyncio as asyncio
+    except ImportError:
+        import asyncio
+    return asyncio
+
+
+class Output:
+    """
+    Collect terminal output in a preallocated buffer while a frame is open,
+    so a whole screen update goes out in one write instead of dozens of
+    tiny ones. Outside of a frame, writes go straight to stdout. Frames
+    can be nested and are flushed when the outermost one ends.
+
+    Example:
+        with terminal.frame():
+            terminal.cursor.coord = (1, 1)
+            terminal.write('Hello')
+    """
+
+    def __init__(self, size=512):
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        self._fill = 0
+        self._depth = 0
+        self._raw = getattr(stdout, "buffer", None)
+
+    def __enter__(self):
+        self._depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._depth -= 1
+        if self._depth == 0:
+            self.flush()
+
+    def write(self, text):
+        if self._depth == 0:
+            stdout.write(text)
+            return
+        data = text.encode()
+        size = len(data)
+        if self._fill + size > len(self._buffer):
+            self.flush()
+            if size > len(self._buffer):
+                stdout.write(text)
+                return
+        self._view[self._fill : self._fill + size] = data
+        self._fill += size
+
+    def flush(self):
+        """
+        Send anything collected so far to the terminal.
+        """
+        if self._fill > 0:
+            if self._raw is not None:
+                if hasattr(stdout, "flush"):
+                    stdout.flush()
+                self._raw.write(self._view[: self._fill])
+            else:
+                stdout.write(bytes(self._view[: self._fill]).decode())
+            self._fill = 0
+        if hasattr(stdout, "flush"):
+            stdout.flush()
+
+
 class Cursor:
-    def __init__(self):
-        pass
+    """
+    Move the cursor and keep track of where it is. The position is worked
+    out locally from what gets written, so reading `coord` doesn't have to
+    wait on the terminal. Call `sync()` to ask the terminal when the
+    position may have changed behind our back (e.g. after print or input.)
+    """
+
+    def __init__(self, output=None):
+        self._output = Output() if output is None else output
+        self._line = None  # None means the position is unknown.
+        self._col = None
+        self._saved = None
+        self.lines = None  # Screen size, filled in by ANSI.reset()
+        self.cols = None
+        self.region = None  # (top, bottom) rows of the scroll region
 
     def __str__(self):
         line, col = self.get_coord()
         return "Ln: {:d}, Col: {:d}".format(line, col)
 
-    def get_coord(self):
+    def sync(self):
         """
-        Return cursor (line, col) coordinates as a tuple.
+        Ask the terminal for the cursor position and return it as a
+        (line, col) tuple.
         """
-        stdout.write(ANSI.CSI + "6n")
+        self._output.write(ANSI.CSI + "6n")
+        self._output.flush()
         reply = ""  # Expecting reply with no newline in the form: 'ESC[{line};{col}R'
         while True:
             ch = stdin.read(1)
@@ -36,17 +122,82 @@ class Cursor:
         if match("[0-9]+;[0-9]+R", reply):
             reply = reply.rstrip("R")
             line, col = reply.split(";")
+            self._line, self._col = int(line), int(col)
         else:
-            line, col = (0, 0)  # Coordinates are 1-based, so (0,0) is impossible.
+            self.invalidate()
+            return 0, 0  # Coordinates are 1-based, so (0,0) is impossible.
+
+        return self._line, self._col
 
-        return int(line), int(col)
+    def invalidate(self):
+        """
+        Forget the cursor position, so the next read asks the terminal.
+        """
+        self._line = None
+        self._col = None
+
+    def get_coord(self):
+        """
+        Return cursor (line, col) coordinates as a tuple.
+        """
+        if self._line is None:
+            return self.sync()
+        return self._line, self._col
 
     def set_coord(self, line_col):
         """
         Move cursor to new line, col coordinates.
         """
         line, col = line_col
-        stdout.write(ANSI.CSI + "{:d};{:d}H".format(line, col))
+        self._output.write(ANSI.CSI + "{:d};{:d}H".format(line, col))
+        if self.lines is None:
+            self.invalidate()  # Screen size not known, so no idea where it stopped.
+        else:
+            self._line = min(max(line, 1), self.lines)
+            self._col = min(max(col, 1), self.cols)
+
+    def _bottom(self):
+        """
+        Return the last row the cursor can reach by moving down a line.
+        """
+        if self.region is not None and self._line <= self.region[1]:
+            return self.region[1]
+        return self.lines
+
+    def down(self):
+        """
+        Account for the cursor going to the start of the next line.
+        """
+        if self._line is not None and self.lines is not None:
+            self._line = min(self._line + 1, self._bottom())
+            self._col = 1
+
+    def advance(self, text):
+        """
+        Account for text written at the cursor position. Anything that
+        makes the position uncertain, like control characters or running
+        off the end of the line, means the next read asks the terminal.
+        """
+        if self._line is None or self.cols is None:
+            return
+        col = self._col
+        for ch in text:
+            if ch == "\n":
+                self.down()
+                col = 1
+            elif ch == "\r":
+                col = 1
+            elif ch == "\b":
+                col = max(col - 1, 1)
+            elif ch < " ":
+                self.invalidate()
+                return
+            else:
+                col += 1
+        if col > self.cols + 1:
+            self.invalidate()
+            return
+        self._col = min(col, self.cols)  # Sitting on the last column, waiting to wrap.
 
     coord = property(get_coord, set_coord)
 
@@ -54,25 +205,188 @@ class Cursor:
         """
         Make the cursor visible on the terminal screen.
         """
-        stdout.write(ANSI.CSI + "?25h")
+        self._output.write(ANSI.CSI + "?25h")
 
     def hide(self):
         """
         Remove the cursor from the screen.
         """
-        stdout.write(ANSI.CSI + "?25l")
+        self._output.write(ANSI.CSI + "?25l")
 
     def save(self):
         """
         Ask terminal to save the cursor position, text attributes, and colors.
         """
-        stdout.write(ANSI.ESC + "7")
+        self._output.write(ANSI.ESC + "7")
+        self._saved = (self._line, self._col)
 
     def restore(self):
         """
         Restore the previously saved position, attributes, and colors.
         """
-        stdout.write(ANSI.ESC + "8")
+        self._output.write(ANSI.ESC + "8")
+        if self._saved is None:
+            self.invalidate()
+        else:
+            self._line, self._col = self._saved
+
+
+class Screen:
+    """
+    Remember the text on each row of the terminal, so redrawing sends only
+    the rows that actually changed. Rows are numbered from 1.
+    """
+
+    def __init__(self, terminal):
+        self.terminal = terminal
+        self.invalidate()
+
+    def invalidate(self, row=None):
+        """
+        Forget what is on a row (or all rows), forcing it to be redrawn.
+        """
+        if row is None:
+            self._text = [None] * (self.terminal.lines + 1)
+            self._style = [None] * (self.terminal.lines + 1)
+            self._spans = [None] * (self.terminal.lines + 1)
+        else:
+            self._text[row] = None
+
+    def draw(self, row, text, style=None, spans=None):
+        """
+        Show text on a row, unless it is already there. Return True if
+        anything was sent to the terminal. Parts of the text can be given
+        their own attributes with spans, a tuple of (start, stop, (style,
+        foreground, background)) in order.
+        """
+        text = text[: self.terminal.cols]
+        old_text = self._text[row]
+        if (
+            old_text == text
+            and self._style[row] == style
+            and self._spans[row] == spans
+        ):
+            return False
+        self.terminal.cursor.coord = (row, 1)
+        if style is not None:
+            self.terminal.style = style
+        if spans is None:
+            self.terminal.write(text)
+        else:
+            position = 0
+            for start, stop, attributes in spans:
+                if start >= len(text):
+                    break
+                if start > position:
+                    self.terminal.write(text[position:start])
+                self.terminal.attributes = attributes
+                self.terminal.write(text[start:stop])
+                del self.terminal.attributes
+                position = stop
+            if position < len(text):
+                self.terminal.write(text[position:])
+        if style is not None:
+            self.terminal.style = ANSI.NORMAL
+        if len(text) < self.terminal.cols and (
+            old_text is None or len(text) < len(old_text)
+        ):
+            self.terminal.clear_line(before_cursor=False, after_cursor=True)
+        self._text[row] = text
+        self._style[row] = style
+        self._spans[row] = spans
+        return True
+
+    def scroll_up(self, top, bottom):
+        """
+        Move rows top..bottom up by one, leaving the bottom row blank. The
+        terminal scroll region must already be set to the same rows.
+        """
+        self.terminal.scroll_up()
+        self._text[top:bottom] = self._text[top + 1 : bottom + 1]
+        self._style[top:bottom] = self._style[top + 1 : bottom + 1]
+        self._spans[top:bottom] = self._spans[top + 1 : bottom + 1]
+        self._text[bottom] = ""
+        self._style[bottom] = None
+        self._spans[bottom] = None
+
+    def scroll_down(self, top, bottom):
+        """
+        Move rows top..bottom down by one, leaving the top row blank.
+        """
+        self.terminal.scroll_down()
+        self._text[top + 1 : bottom + 1] = self._text[top:bottom]
+        self._style[top + 1 : bottom + 1] = self._style[top:bottom]
+        self._spans[top + 1 : bottom + 1] = self._spans[top:bottom]
+        self._text[top] = ""
+        self._style[top] = None
+        self._spans[top] = None
+
+
+class KeyDecoder:
+    """
+    Turn characters read from the terminal into key codes, one character
+    at a time, so keypad escape sequences can arrive in pieces.
+    """
+
+    IDLE = 0
+    ESCAPE = 1  # Got ESC, waiting to see if a sequence follows.
+    CSI = 2  # Got ESC[, collecting up to the final character.
+    SS3 = 3  # Got ESCO, next character is the key.
+
+    ss3_sequence = {"P": 0x109, "Q": 0x10A, "R": 0x10B, "S": 0x10C}  # F1..F4
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._state = KeyDecoder.IDLE
+        self._sequence = ""
+
+    def pending(self):
+        """
+        Return True when part of an escape sequence has been read.
+        """
+        return self._state != KeyDecoder.IDLE
+
+    def feed(self, ch, use_keypad=True):
+        """
+        Take one character and return a key code once a whole key has
+        been read, or None if more characters are needed. Sequences that
+        aren't recognized are dropped.
+        """
+        state = self._state
+        if state == KeyDecoder.IDLE:
+            if ch == ANSI.ESC and use_keypad is True:
+                self._state = KeyDecoder.ESCAPE
+                return None
+            return ord(ch)
+        if state == KeyDecoder.ESCAPE:
+            if ch == "[":
+                self._state = KeyDecoder.CSI
+                return None
+            if ch == "O":
+                self._state = KeyDecoder.SS3
+                return None
+            self.reset()  # Alt+key style pair. Report the ESC, drop the rest.
+            return ANSI.KEY_ESC
+        if state == KeyDecoder.SS3:
+            self.reset()
+            return KeyDecoder.ss3_sequence.get(ch) or ANSI.keypad_sequence.get(ch)
+        self._sequence += ch
+        if ord(ch) > 0x3F and ord(ch) < 0x7F:  # Final character of CSI sequence
+            key = ANSI.keypad_sequence.get(self._sequence)
+            self.reset()
+            return key
+        return None
+
+    def timeout(self):
+        """
+        Nothing more arrived after part of a sequence. A lone ESC is the
+        escape key. Anything else is dropped.
+        """
+        key = ANSI.KEY_ESC if self._state == KeyDecoder.ESCAPE else None
+        self.reset()
+        return key
 
 
 class ANSI:
@@ -121,6 +435,8 @@ class ANSI:
     KEY_PPAGE = 0x153  # Prev page (PgUp)
     KEY_END = 0x168
 
+    ESC_TIMEOUT = 50  # ms to wait for the rest of an escape sequence
+
     keypad_sequence = {
         "A": KEY_UP,
         "B": KEY_DOWN,
@@ -141,20 +457,43 @@ class ANSI:
     }
 
     def __init__(self):
-        self.cursor = Cursor()
+        self.output = Output()
+        self.cursor = Cursor(self.output)
         self.echo = True
         self.use_keypad = True
+        self._keys = KeyDecoder()
+        self._poll = poll()
+        self._poll.register(stdin, POLLIN)
+        self._stream = None
         self.reset()
 
+    ### Output ###
+
+    def write(self, text):
+        """
+        Send text to the terminal, batched if a frame is open.
+        """
+        self.output.write(text)
+        self.cursor.advance(text)
+
+    def frame(self):
+        """
+        Return a context manager that batches everything written inside
+        it into a single write to the terminal.
+        """
+        return self.output
+
     ### Entire Screen ###
 
     def reset(self):
         """
         Reset terminal and probe for terminal dimensions. Clears screen.
         """
-        stdout.write(ANSI.ESC + "c")
+        self.output.write(ANSI.ESC + "c")
+        self.cursor.lines = self.cursor.cols = self.cursor.region = None
         self.cursor.coord = (999, 999)  # It will stop at (last line, last col).
-        self.lines, self.cols = self.cursor.coord
+        self.lines, self.cols = self.cursor.sync()
+        self.cursor.lines, self.cursor.cols = self.lines, self.cols
         self.cursor.coord = (1, 1)
 
     def clear(self, before_cursor=True, after_cursor=True, clear_scrollback=False):
@@ -163,7 +502,7 @@ class ANSI:
         lines before/after the cursor line.
         """
         if clear_scrollback is True:
-            stdout.write(ANSI.CSI + "3J")
+            self.output.write(ANSI.CSI + "3J")
 
         if after_cursor and not before_cursor:
             control_sequence = "J"
@@ -172,7 +511,7 @@ class ANSI:
         elif after_cursor and before_cursor:
             control_sequence = "2J"
 
-        stdout.write(ANSI.CSI + control_sequence)
+        self.output.write(ANSI.CSI + control_sequence)
 
     ### Scroll Region ###
 
@@ -183,18 +522,22 @@ class ANSI:
         if len(row_range) != 2:
             return False
         top, bottom = row_range
-        stdout.write(ANSI.CSI + "{:d};{:d}r".format(top, bottom))
+        self.output.write(ANSI.CSI + "{:d};{:d}r".format(top, bottom))
+        self.cursor.region = (top, bottom)
+        self.cursor.set_coord((1, 1))  # Setting a region also homes the cursor.
 
     def clear_scroll_region(self):
-        stdout.write(ANSI.CSI + "r")
+        self.output.write(ANSI.CSI + "r")
+        self.cursor.region = None
+        self.cursor.set_coord((1, 1))
 
     scroll_region = property(None, set_scroll_region, clear_scroll_region)
 
     def scroll_up(self):
-        stdout.write(ANSI.CSI + "S")
+        self.output.write(ANSI.CSI + "S")
 
     def scroll_down(self):
-        stdout.write(ANSI.CSI + "T")
+        self.output.write(ANSI.CSI + "T")
 
     ### Individual Lines ###
 
@@ -210,13 +553,14 @@ class ANSI:
         elif after_cursor and before_cursor:
             control_sequence = "2K"
 
-        stdout.write(ANSI.CSI + control_sequence)
+        self.output.write(ANSI.CSI + control_sequence)
 
     def next_line(self):
         """
         Go to the next line and position the cursor at the beginning.
         """
-        stdout.write(ANSI.CSI + "E")
+        self.output.write(ANSI.CSI + "E")
+        self.cursor.down()
 
     ### Individual Characters ###
 
@@ -225,7 +569,7 @@ class ANSI:
         Define text style (bold, inverse, etc.) and colors. Refer to
         predefined attribute and color constants for possible values.
         """
-        if len(attributes_triplet != 3):
+        if len(attributes_triplet) != 3:
             return False
         style, fg_color, bg_color = attributes_triplet
         control_sequence = "{:d};".format(style) if style else ""
@@ -233,13 +577,13 @@ class ANSI:
         control_sequence += "{:d};".format(bg_color + 40) if bg_color else ""
         control_sequence = control_sequence.rstrip(";")
         control_sequence += "m"
-        stdout.write(ANSI.CSI + control_sequence)
+        self.output.write(ANSI.CSI + control_sequence)
 
     def clear_attributes(self):
         """
         Reset text attributes and colors back to default.
         """
-        stdout.write(ANSI.CSI + "m")
+        self.output.write(ANSI.CSI + "m")
 
     attributes = property(None, set_attributes, clear_attributes)
 
@@ -251,53 +595,95 @@ class ANSI:
         if len(color_pair) != 2:
             return False
         fg_color, bg_color = color_pair
-        stdout.write(ANSI.CSI + "{:d};{:d}m".format(fg_color + 30, bg_color + 40))
+        self.output.write(ANSI.CSI + "{:d};{:d}m".format(fg_color + 30, bg_color + 40))
 
     def clear_color(self):
         """
         Reset colors to default without affecting attributes (bold, etc.)
         """
-        stdout.write(ANSI.CSI + "39;49m")  # 39;49 represent default.
+        self.output.write(ANSI.CSI + "39;49m")  # 39;49 represent default.
 
     color = property(None, set_color, clear_color)
 
     def set_style(self, style_attr):
-        stdout.write(ANSI.CSI + "{:d}m".format(style_attr))
+        self.output.write(ANSI.CSI + "{:d}m".format(style_attr))
 
     def clear_style(self):
-        stdout.write(ANSI.CSI + ANSI.NORMAL + "m")
+        self.output.write(ANSI.CSI + ANSI.NORMAL + "m")
 
     style = property(None, set_style, clear_style)
 
     ### Keyboard Input ###
 
-    def getch(self):
+    def _key_read(self, key):
+        """
+        Echo a key if wanted and hand it back.
+        """
+        if self.echo is True and key < 0x100:
+            self.write(chr(key))
+        return key
+
+    def getch(self, timeout=None):
         """
         Wait for a keypress and return its value as an integer. Optionally
-        process keypad and function keys.
+        process keypad and function keys. With a timeout (in ms), return
+        None if no key arrives in time.
         """
-        ch = None
-        poll_obj = poll()
-        poll_obj.register(stdin, POLLIN)
         while True:
-            keypress = stdin.read(1) if poll_obj.poll(0) else None
-            if keypress is not None:
-                if self.echo is True:
-                    stdout.write(keypress)
-                ch = ord(keypress)
-                if (
-                    ch != ANSI.KEY_ESC or self.use_keypad is False
-                ):  # Not an ESC sequence
-                    break
-                elif stdin.read(1) == "[":  # ESC[ is Control Sequence Introducer
-                    sequence = ""
-                    while True:
-                        s = stdin.read(1)
-                        sequence += s
-                        if ord(s) > 0x3F and ord(s) < 0x7F:
-                            break
-                    ch = ANSI.keypad_sequence.get(sequence)
-                    break
-        return ch
+            if self._keys.pending():
+                wait = ANSI.ESC_TIMEOUT
+            else:
+                wait = -1 if timeout is None else timeout
+            if not self._poll.poll(wait):
+                if not self._keys.pending():
+                    return None
+                key = self._keys.timeout()
+            else:
+                key = self._keys.feed(stdin.read(1), self.use_keypad)
+            if key is not None:
+                return self._key_read(key)
+
+    async def _read_char(self):
+        """
+        Wait for one character from the terminal without blocking other
+        tasks.
+        """
+        asyncio = _asyncio()
+        if implementation.name == "micropython":
+            if self._stream is None:
+                self._stream = asyncio.StreamReader(stdin)
+            return await self._stream.read(1)
+        while not self._poll.poll(0):  # CPython can't wrap stdin, so nap.
+            await asyncio.sleep(ANSI.ESC_TIMEOUT / 1000)
+        return stdin.read(1)
+
+    async def agetch(self):
+        """
+        Like getch(), but for use with asyncio. Other tasks keep running
+        while waiting for a key.
+        """
+        asyncio = _asyncio()
+        while True:
+            if self._keys.pending():
+                try:
+                    ch = await asyncio.wait_for(
+                        self._read_char(), ANSI.ESC_TIMEOUT / 1000
+                    )
+                except asyncio.TimeoutError:
+                    ch = None
+            else:
+                ch = await self._read_char()
+            if ch is None:
+                key = self._keys.timeout()
+            else:
+                key = self._keys.feed(ch, self.use_keypad)
+            if key is not None:
+                return self._key_read(key)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.agetch()
 
     ch = property(getch)
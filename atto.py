@@ -2,18 +2,140 @@
 #   (combining form) a metric system unit prefix denoting 10 to the -18 power
 #   (noun) a tiny line-based text editor modeled as a subset of the ed editor
 
-from sys import stdout, exit
+import sys
+from sys import exit
+from array import array
+from external_sort import sort_lines
+from layout import Layout
+from regex_cache import get_regex
+from marks import MarkList, NamedMarks
 from text_buffer import TextBuffer
 
 
+# Kinds of address, kept as (kind, value, offset) in a compiled Command
+LINE = 0  # line number value
+CURRENT = 1  # .
+LAST = 2  # $
+PAGE = 3  # end of a > page, 22 lines on from the current one
+FORWARD = 4  # /regexp/
+BACKWARD = 5  # ?regexp?
+MARK = 6  # 'x
+BAD = 7  # not a usable address
+
+
+_address_chars = "0123456789.$/?'+-"  # Any of these starts an address.
+
+
+def _number(text, i):
+    """
+    Return the decimal number starting at text[i], or None if there isn't
+    one, and the position just after it.
+    """
+    start = i
+    n = 0
+    while i < len(text):
+        digit = ord(text[i]) - 48
+        if digit < 0 or digit > 9:
+            break
+        n = n * 10 + digit
+        i += 1
+    return (n if i > start else None), i
+
+
+def _compile_address(text, i):
+    """
+    Read one address starting at text[i]. Return it as (kind, value,
+    offset), or None if there isn't one there, and the position just
+    after it.
+    """
+    if i >= len(text) or text[i] not in _address_chars:
+        return None, i
+    ch = text[i]
+    kind = CURRENT  # +n and -n on their own count from the current line.
+    value = None
+    offset = 0
+    if "0" <= ch <= "9":
+        kind = LINE
+        value, i = _number(text, i)
+    elif ch == "." or ch == "$":
+        kind = CURRENT if ch == "." else LAST
+        i += 1
+    elif ch == "/" or ch == "?":
+        # The closing delimiter can be left off at the end.
+        kind = FORWARD if ch == "/" else BACKWARD
+        end = i + 1
+        while end < len(text) and text[end] != ch:
+            end += 2 if text[end] == "\\" else 1
+        value = text[i + 1 : min(end, len(text))]
+        i = min(end + 1, len(text))
+    elif ch == "'":
+        kind = MARK if text[i + 1 : i + 2].isalpha() else BAD
+        value = text[i + 1 : i + 2]
+        i = min(i + 2, len(text))
+    while i < len(text) and (text[i] == "+" or text[i] == "-"):
+        sign = 1 if text[i] == "+" else -1
+        n, i = _number(text, i + 1)
+        offset += sign * (1 if n is None else n)
+    return (kind, value, offset), i
+
+
+class Command:
+    """
+    A command line compiled by Atto.compile(). Addresses are kept as
+    written and only turned into line numbers when the command runs,
+    since they depend on the current line, so the same Command can be
+    run any number of times.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.text = None  # the command string it was compiled from
+        self.first = None  # address, as (kind, value, offset)
+        self.second = None
+        self.separator = None  # "," or ";" between two addresses
+        self.cmd = None
+        self.param = None
+
+
+class _Quiet:
+    """
+    Stands in for stdout when output isn't wanted.
+    """
+
+    def write(self, text):
+        pass
+
+
 class Atto(TextBuffer):
     """
-    A primitive line editor, painfully similar to the ed editor, but
-    with without the cool regex stuff.
+    A primitive line editor, painfully similar to the ed editor, with
+    a little of the cool regex stuff (s, g and v).
     """
 
     cmd_prompt = "*"
     text_prompt = ">"
+    line_width = None  # Wrap p and n output to this many columns.
+    _output = None  # Where messages and printed lines go, if not stdout.
+    _line_layout = None
+    _script = None  # Iterator over script lines, while running one.
+    _command = None  # Reused by each command that is typed.
+    _named_marks = None
+    _script_line = 0
+    _script_end = None  # Set by q, q! or Q to stop the script running.
+
+    def get_output(self):
+        """
+        Return the stream messages and printed lines are written to.
+        sys.stdout is looked up each time, so redirecting it works.
+        """
+        return sys.stdout if self._output is None else self._output
+
+    def set_output(self, stream):
+        self._output = stream
+
+    output = property(get_output, set_output)
 
     def help(self, **kwargs):
         """
@@ -31,6 +153,10 @@ class Atto(TextBuffer):
                 "$           last line",
                 "%           all lines 1,$",
                 "/regexp/    next matching line",
+                "?regexp?    previous matching line",
+                "'x          line marked with x",
+                "{addr}+{n}  n lines after addr (or -{n} before)",
+                "{a1};{a2}   range, with a2 found from a1",
                 "",
                 "Command Summary",
                 "---------------------------------------",
@@ -39,36 +165,56 @@ class Atto(TextBuffer):
                 "{n1},{n2}d  Delete line(s)",
                 "e [path]    Edit new file",
                 "f [path]    View/change filename",
+                "{n1},{n2}g/re/cmd  Run cmd on matching lines",
                 "{n}i        Insert new line(s) before",
+                "{n}kx       Mark line with x",
                 "{n1},{n2}n  Print with numbered lines",
                 "{n1},{n2}p  Print",
                 "q           Quit",
+                "{n1},{n2}s/re/new/[g]  Substitute",
+                "{n1},{n2}S [rnu]  Sort line(s)",
+                "u           Undo last change",
+                "U           Redo last undone change",
+                "{n1},{n2}v/re/cmd  Run cmd on lines not matching",
                 "w [path]    Write (save) buffer to file",
             ]
         )
-        stdout.write(help_text + "\n")
+        self.output.write(help_text + "\n")
 
     def _input_multiline(self):
         """
         Yield user input as lines until a single . is encountered.
         Used by insert and append operations.
         """
-        stdout.write("Enter a single . to exit input mode.\n")
+        self.output.write("Enter a single . to exit input mode.\n")
         while True:
-            text = input(self.text_prompt)
-            if text != ".":
+            text = self._read_line(self.text_prompt)
+            if text is not None and text != ".":
                 yield text
             else:
                 return
 
+    def _read_line(self, prompt):
+        """
+        Return a line typed in reply to prompt or, when running a script,
+        the next line of the script (None at the end of it.)
+        """
+        if self._script is None:
+            return input(prompt)
+        line = next(self._script, None)
+        if line is not None:
+            self._script_line += 1
+            line = line.rstrip("\r\n")
+        return line
+
     def _prompt_filename(self, prompt="Filename"):
         """
         Ask for a filename offering the current one as a default value.
         """
         if self.filename is None:
-            filename = input("{:s} [{:s}]: ".format(prompt, self.filename))
+            filename = self._read_line("{:s} [{:s}]: ".format(prompt, self.filename))
         else:
-            filename = input("{:s}: ".format(prompt))
+            filename = self._read_line("{:s}: ".format(prompt))
         return filename
 
     def _is_valid_addr(self, start=None, stop=None, dest=None, zero_start_ok=False):
@@ -96,11 +242,95 @@ class Atto(TextBuffer):
 
         return True
 
+    def _range(self, kwargs):
+        """
+        Return the start and stop addresses a command was given, with the
+        current line for start and start for stop when they were left off.
+        An address of 0 or -1 is kept, so it fails as a bad address instead
+        of being taken for no address at all.
+        """
+        start = kwargs.get("start")
+        if start is None:
+            start = self._current_line
+        stop = kwargs.get("stop")
+        if stop is None:
+            stop = start
+        return start, stop
+
+    def _layout(self, indent=0):
+        """
+        Return the Layout for wrapping lines shown after indent columns,
+        or None when lines aren't wrapped.
+        """
+        if self.line_width is None:
+            return None
+        width = self.line_width - indent
+        if self._line_layout is None:
+            self._line_layout = Layout(width)
+        elif self._line_layout.width != width:
+            self._line_layout.set_width(width)
+        return self._line_layout
+
+    def _split_pattern(self, text, max_parts):
+        """
+        Split text like '/re/new/g' on its first character. A delimiter
+        with a backslash in front is kept as part of the text. After
+        max_parts pieces, the rest is returned in one piece as-is.
+        """
+        delim = text[0]
+        parts = []
+        part = ""
+        i = 1
+        while i < len(text):
+            ch = text[i]
+            if len(parts) == max_parts:
+                part = text[i:]
+                break
+            if ch == "\\" and text[i + 1 : i + 2] == delim:
+                part += delim
+                i += 2
+                continue
+            if ch == delim:
+                parts.append(part)
+                part = ""
+            else:
+                part += ch
+            i += 1
+        parts.append(part)
+        return parts
+
+    def _get_regex(self, expr):
+        """
+        Compile expr, or reuse the last one when it is empty, like ed.
+        """
+        if expr == "":
+            expr = getattr(self, "_last_expr", None)
+            if expr is None:
+                return None
+        self._last_expr = expr
+        return get_regex(expr)
+
+    def _replacement(self, text):
+        """
+        Turn ed's & (the whole match) into the \\g<0> re.sub expects.
+        """
+        result = ""
+        i = 0
+        while i < len(text):
+            ch = text[i]
+            if ch == "\\" and text[i + 1 : i + 2] == "&":
+                result += "&"
+                i += 2
+                continue
+            result += "\\g<0>" if ch == "&" else ch
+            i += 1
+        return result
+
     def append(self, **kwargs):
         """
         Add new lines after the indicated line number.
         """
-        start = kwargs.get("start") or self._current_line
+        start = self._range(kwargs)[0]
         if self._is_valid_addr(start, zero_start_ok=True) is False:
             return False
 
@@ -114,15 +344,18 @@ class Atto(TextBuffer):
         """
         Replace line(s) with new line(s).
         """
-        self.delete(**kwargs)
-        self.insert(**kwargs)
+        start, stop = self._range(kwargs)
+        if self._is_valid_addr(start, stop) is False:
+            return False
+        self.delete_range(start, stop)
+        self._current_line = start - 1  # Appending after it works at the end too.
+        return self.append()
 
     def delete(self, **kwargs):
         """
         Remove a range of lines from the buffer.
         """
-        start = kwargs.get("start") or self._current_line
-        stop = kwargs.get("stop") or start
+        start, stop = self._range(kwargs)
         if self._is_valid_addr(start, stop) is False:
             return False
         self.delete_range(start, stop)
@@ -133,11 +366,12 @@ class Atto(TextBuffer):
         Load a new file into the buffer.
         """
         if self._is_dirty is True:
-            stdout.write("Unsaved changes exist. Use uppercase E to override.\n")
+            self.output.write("Unsaved changes exist. Use uppercase E to override.\n")
         else:
             filename = kwargs.get("param") or self.filename or self._prompt_filename()
             if filename is not None:
                 self.purge()
+                self._get_marks().clear()
                 self.load(filename)
                 self._is_dirty = False
                 self._current_line = len(self._buffer)
@@ -158,13 +392,61 @@ class Atto(TextBuffer):
         if new_name != "":
             self.filename = new_name
         else:
-            stdout.write((self.filename or "(none)") + "\n")
+            self.output.write((self.filename or "(none)") + "\n")
+
+    def global_cmd(self, invert=False, **kwargs):
+        """
+        Mark every line in the range that matches (or with invert, every
+        line that doesn't), then run a command on each marked line.
+        """
+        start = kwargs.get("start")
+        if start is None:
+            start, stop = 1, len(self._buffer)
+        else:
+            stop = self._range(kwargs)[1]
+        param = kwargs.get("param")
+        if not isinstance(param, str) or param == "":
+            return False
+        if self._is_valid_addr(start, stop) is False:
+            return False
+        parts = self._split_pattern(param, 1)
+        regex = self._get_regex(parts[0])
+        # Compiled once here, then run on every marked line.
+        command = self.compile(parts[1] if len(parts) > 1 else "")
+        if command.cmd is None:
+            command.cmd = "p"
+        if regex is None or command.cmd in "gv":
+            return False
+
+        marks = MarkList(array("I"))
+        line_num = start
+        for line in self.get_lines(start, stop):
+            if (regex.search(line) is None) is invert:
+                marks.append(line_num)
+            line_num += 1
+        if len(marks) == 0:
+            self.output.write("No match.\n")
+            return None
+
+        self._mark_lists.append(marks)
+        try:
+            for line_num in marks:
+                self._current_line = line_num
+                self.run_command(command)
+        finally:
+            self._mark_lists.remove(marks)
+
+    def global_inverse(self, **kwargs):
+        """
+        Run a command on every line in the range that doesn't match.
+        """
+        return self.global_cmd(invert=True, **kwargs)
 
     def insert(self, **kwargs):
         """
         Add new lines after the indicated line number.
         """
-        start = kwargs.get("start") or self._current_line
+        start = self._range(kwargs)[0]
         if self._is_valid_addr(start) is False:
             return False
 
@@ -178,23 +460,46 @@ class Atto(TextBuffer):
         """
         Combine lines.
         """
-        start = kwargs.get("start") or self._current_line
-        stop = kwargs.get("stop") or self._current_line
+        start = self._range(kwargs)[0]
+        stop = kwargs.get("stop")
+        if stop is None:
+            stop = self._current_line
         if self._is_valid_addr(start, stop) is False:
             return False
 
-        self._buffer[start - 1 : stop] = ["".join(self._buffer[start - 1 : stop])]
+        self.update_line(start, "".join(self.get_lines(start, stop)))
+        if stop > start:
+            self.delete_range(start + 1, stop)
         self._current_line = start
-        self._is_dirty = True
+
+    def _get_marks(self):
+        """
+        Return the marks set by k, which follow their lines as they move.
+        """
+        if self._named_marks is None:
+            self._named_marks = NamedMarks()
+            self._mark_lists.append(self._named_marks)
+        return self._named_marks
+
+    def mark(self, **kwargs):
+        """
+        Mark a line with a letter, so 'x can be used as its address.
+        """
+        start = self._range(kwargs)[0]
+        name = kwargs.get("param")
+        if not isinstance(name, str) or len(name) != 1 or not name.isalpha():
+            return False
+        if self._is_valid_addr(start) is False:
+            return False
+        self._get_marks().set(name, start)
 
     def move(self, **kwargs):
         """
         Like transfer but remove the source range after the copy.
         """
-        start = kwargs.get("start")
-        stop = kwargs.get("stop") or start
+        start, stop = self._range(kwargs)
         dest = kwargs.get("param")
-        if self._is_valid_addr(start, stop) is False:
+        if self._is_valid_addr(start, stop) is False or not isinstance(dest, int):
             return False
         self.copy_range(start, stop, dest)
         offset = stop - start + 1 if (dest < start) else 0
@@ -205,8 +510,7 @@ class Atto(TextBuffer):
         """
         Print lines prefixed with line numbers.
         """
-        start = kwargs.get("start") or self._current_line
-        stop = kwargs.get("stop") or start
+        start, stop = self._range(kwargs)
         if self._is_valid_addr(start, stop) is False:
             return False
 
@@ -219,63 +523,164 @@ class Atto(TextBuffer):
         else:
             line_num_field = "{:>4d}"
 
+        indent = len(line_num_field.format(stop)) + 1
+        layout = self._layout(indent)
         line_num = start
-        while line_num <= stop:
-            stdout.write(line_num_field.format(line_num) + " ")
-            stdout.write(self.get_line(line_num) + "\n")
+        for line in self.get_lines(start, stop):
+            self.output.write(line_num_field.format(line_num) + " ")
+            if layout is None:
+                self.output.write(line + "\n")
+            else:
+                prefix = ""
+                for segment_start, segment_stop in layout.segments(line):
+                    self.output.write(prefix + line[segment_start:segment_stop] + "\n")
+                    prefix = " " * indent
             line_num += 1
         self._current_line = stop
 
     def print(self, **kwargs):
         """
-        Display a range of buffer lines, possibly truncated to fit.
+        Display a range of buffer lines, possibly truncated or wrapped to fit.
         """
-        start = kwargs.get("start") or self._current_line
-        stop = kwargs.get("stop") or start
+        start, stop = self._range(kwargs)
         line_length = kwargs.get("line_length")
         if self._is_valid_addr(start, stop) is False:
             return False
 
-        line_num = start
-        while line_num <= stop:
-            if line_length is None:
-                stdout.write(self.get_line(line_num) + "\n")
+        layout = self._layout()
+        for line in self.get_lines(start, stop):
+            if line_length is not None:
+                self.output.write(line[:line_length] + "\n")
+            elif layout is None:
+                self.output.write(line + "\n")
             else:
-                stdout.write(self.get_line(line_num)[:line_length] + "\n")
-            line_num += 1
+                for segment_start, segment_stop in layout.segments(line):
+                    self.output.write(line[segment_start:segment_stop] + "\n")
         self._current_line = stop
 
     def quit(self, **kwargs):
+        if self._script is not None:  # Ends the script, not the program.
+            self._script_end = "!" if kwargs.get("param") == "!" else "q"
+            return None
         if self._is_dirty is False or kwargs.get("param") == "!":
             self.quit_unconditional()
         else:
-            stdout.write("Unsaved changes exist. Use uppercase Q to override.\n")
+            self.output.write("Unsaved changes exist. Use uppercase Q to override.\n")
 
     def quit_unconditional(self, **kwargs):
+        if self._script is not None:
+            self._script_end = "Q"
+            return None
         del self._buffer
         exit(0)
 
     def show_line_number(self, **kwargs):
-        line_num = kwargs.get("start") or self._current_line
-        stdout.write(str(line_num) + "\n")
+        line_num = self._range(kwargs)[0]
+        if self._is_valid_addr(line_num, zero_start_ok=True) is False:
+            return False
+        self.output.write(str(line_num) + "\n")
+
+    def substitute(self, **kwargs):
+        """
+        Replace text matching a regex in a range of lines, s/re/new/ or
+        s/re/new/g for every match on the line instead of just the first.
+        """
+        start, stop = self._range(kwargs)
+        param = kwargs.get("param")
+        if not isinstance(param, str) or param == "":
+            return False
+        if self._is_valid_addr(start, stop) is False:
+            return False
+        parts = self._split_pattern(param, 2)
+        regex = self._get_regex(parts[0])
+        if regex is None:
+            return False
+        replacement = self._replacement(parts[1] if len(parts) > 1 else "")
+        flags = parts[2] if len(parts) > 2 else ""
+        count = 0 if "g" in flags else 1
+
+        changes = []  # Collected first, since lines can't change while read.
+        line_num = start
+        for line in self.get_lines(start, stop):
+            if regex.search(line) is not None:
+                changes.append((line_num, regex.sub(replacement, line, count)))
+            line_num += 1
+        if not changes:
+            self.output.write("No match.\n")
+            return None
+
+        for line_num, text in changes:
+            self.update_line(line_num, text)
+        self._current_line = changes[-1][0]
+        if "p" in flags:
+            self.output.write(changes[-1][1] + "\n")
+
+    def sort_range(self, **kwargs):
+        """
+        Sort a range of lines, or all lines if no range is given. S r sorts
+        in reverse, S n by the number each line starts with, and S u drops
+        duplicate lines.
+        """
+        start = kwargs.get("start")
+        if start is None:
+            start, stop = 1, len(self._buffer)
+        else:
+            stop = self._range(kwargs)[1]
+        flags = kwargs.get("param")
+        if flags is None:
+            flags = ""
+        if not isinstance(flags, str) or self._is_valid_addr(start, stop) is False:
+            return False
+
+        lines = sort_lines(
+            self.get_lines(start, stop), "r" in flags, "n" in flags, "u" in flags
+        )
+        first = next(lines)  # Every line has been read once there is a first.
+        self.delete_range(start, stop)
+
+        def sorted_lines():
+            yield first
+            yield from lines
+
+        count = self.insert_lines(start, sorted_lines())
+        self._current_line = start + count - 1
 
     def toggle_verbosity(self, **kwargs):
         self.verbose = not self.verbose
         state = "on" if self.verbose else "off"
-        stdout.write("Verbose messages: {}\n".format(state))
+        self.output.write("Verbose messages: {}\n".format(state))
 
     def transfer(self, **kwargs):
         """
         Copy lines start..stop to the line after dest.
         """
-        start = kwargs.get("start")
-        stop = kwargs.get("stop") or start
+        start, stop = self._range(kwargs)
         dest = kwargs.get("param")
-        if self._is_valid_addr(start, stop) is False:
+        if self._is_valid_addr(start, stop) is False or not isinstance(dest, int):
             return False
         self.copy_range(start, stop, dest)
         self._current_line = dest + stop - start + 1
 
+    def undo_change(self, **kwargs):
+        """
+        Reverse the last command that changed the buffer.
+        """
+        line_num = self.undo()
+        if line_num is None:
+            self.output.write("Nothing to undo.\n")
+        else:
+            self._current_line = min(max(line_num, 1), len(self._buffer))
+
+    def redo_change(self, **kwargs):
+        """
+        Put back the last change that was undone.
+        """
+        line_num = self.redo()
+        if line_num is None:
+            self.output.write("Nothing to redo.\n")
+        else:
+            self._current_line = min(max(line_num, 1), len(self._buffer))
+
     def write(self, **kwargs):
         """
         Save the buffer to a file.
@@ -284,131 +689,259 @@ class Atto(TextBuffer):
         if filename:
             result = self.save(filename)
             if result is False:
-                stdout.write("Write failed!\n")
+                self.output.write("Write failed!\n")
 
-    def parse(self, cmd_string):
+    def compile(self, cmd_string, command=None):
         """
-        Split a command string into address range, command, and parameter.
+        Read a command string in one pass into a Command, reusing command
+        if one is given. Addresses can be any of {n} . $ /re/ ?re? 'x,
+        each followed by +{n} or -{n}, and two of them separated by , or ;
+        to make a range. % and > stand for whole ranges.
         """
+        if command is None:
+            command = Command()
+        else:
+            command.clear()
+        command.text = cmd_string
         if cmd_string is None or cmd_string == "":
-            return None, None, None, None
-
-        # RegEx address format can be '/expr' or '/expr/'
-        # 'expr' and any / will be replaced by address of first match.
-        # Search starts from current line and wraps around if needed.
-        # If nothing found, return bad address to trigger error msg.
-        if cmd_string.startswith("/") is True:
-            closing_slash_position = cmd_string.find("/", 1)
-            if closing_slash_position == -1:
-                expr = cmd_string[1:]
-                line_num = self.find_line(
-                    expr, self._current_line + 1
-                ) or self.find_line(expr)
-                if line_num is not None:
-                    cmd_string = cmd_string.replace("/" + expr, str(line_num))
-                else:
-                    return -1, None, "p", None
-            else:
-                expr = cmd_string[1:closing_slash_position]
-                line_num = self.find_line(
-                    expr, self._current_line + 1
-                ) or self.find_line(expr)
-                if line_num is not None:
-                    cmd_string = cmd_string.replace("/" + expr + "/", str(line_num))
-                else:
-                    return -1, None, "p", None
-
-        # Numeric format can be a single line number, like {n}
-        # or a range, like {n1},{n2} Addresses can have the familiar ed/vi
-        # characters like . % $  There is also > which equates to the range
-        # of current_line to current_line+20 which is useful for paging.
-        cmd_location = 0
-        for ch in cmd_string:
-            if ch not in "0123456789$%,.>":  # all valid address range chars
-                break
-            cmd_location += 1
-
-        if cmd_location == 0:
-            addr1 = None
-            addr2 = None
+            return command
+
+        i = 0
+        if cmd_string[0] == "%":  # entire buffer
+            command.first, command.second = (LINE, 1, 0), (LAST, None, 0)
+            i = 1
+        elif cmd_string[0] == ">":  # page forward
+            command.first, command.second = (CURRENT, None, 0), (PAGE, None, 0)
+            i = 1
         else:
-            addr_range = cmd_string[0:cmd_location]
-            if addr_range[0] == "%":  # entire buffer
-                addr_range = addr_range.replace("%", "1,$")
-            if addr_range[0] == ">":  # page forward
-                stop_line = self._current_line + 22
-                if stop_line > len(self._buffer):
-                    stop_line = len(self._buffer)
-                addr_range = addr_range.replace(">", ".,{}".format(stop_line))
-
-            addr_range = addr_range.replace(".", str(self._current_line))
-            addr_range = addr_range.replace("$", str(len(self._buffer)))
-
-            if "," in addr_range:
-                addr1 = int(addr_range.split(",")[0])
-                addr2 = int(addr_range.split(",")[1])
-            else:
-                addr1 = int(addr_range)
-                addr2 = None
+            command.first, i = _compile_address(cmd_string, i)
+            if i < len(cmd_string) and cmd_string[i] in ",;":
+                command.separator = cmd_string[i]
+                command.second, i = _compile_address(cmd_string, i + 1)
+                if command.first is None:  # , alone is 1,$ and ; alone is .,$
+                    if command.separator == ",":
+                        command.first = (LINE, 1, 0)
+                    else:
+                        command.first = (CURRENT, None, 0)
+                    if command.second is None:
+                        command.second = (LAST, None, 0)
 
         # Commands are single-character and mimic ed's commands. When
         # no command exists, the default action is to 'print' the line.
-        cmd = cmd_string[cmd_location : cmd_location + 1]
-        if cmd == "":
-            cmd = "p"
+        command.cmd = cmd_string[i : i + 1] or "p"
 
         # The single parameter that follows the command is multi-use.
         # In some cases it can be a destination address (move, transfer)
         # or a file path in others (edit, write).
         # The . and $ substitutions are valid here, but not %
-        param = cmd_string[cmd_location + 1 :].strip()
-        if param.isdigit() is True:
-            param = int(param)
-        elif param == ".":
+        param = cmd_string[i + 1 :].strip()
+        command.param = int(param) if param.isdigit() else param
+        return command
+
+    def _search(self, expr, backward=False):
+        """
+        Return the next line after the current one matching expr, wrapping
+        around the end of the buffer, or the previous one when searching
+        backward, like ed. None if no line matches.
+        """
+        regex = self._get_regex(expr)
+        if regex is None:
+            return None
+        line_num = self._current_line
+        if backward is False:
+            for found in self.find_iter(regex, line_num + 1):
+                return found
+            for found in self.find_iter(regex, 1, line_num):
+                return found
+            return None
+        # Lines are read forward, keeping the last match.
+        found = None
+        if line_num > 1:
+            for found in self.find_iter(regex, 1, line_num - 1):
+                pass
+        if found is None:
+            for found in self.find_iter(regex, max(line_num, 1)):
+                pass
+        return found
+
+    def _line(self, address):
+        """
+        Return the line number an address refers to, or -1 if it refers
+        to a line that can't be found.
+        """
+        kind, value, offset = address
+        if kind == LINE:
+            line_num = value
+        elif kind == CURRENT:
+            line_num = self._current_line
+        elif kind == LAST:
+            line_num = len(self._buffer)
+        elif kind == PAGE:
+            line_num = min(self._current_line + 22, len(self._buffer))
+        elif kind == FORWARD or kind == BACKWARD:
+            line_num = self._search(value, kind == BACKWARD)
+        elif kind == MARK:
+            line_num = self._get_marks().get(value)
+        else:
+            line_num = None
+        if line_num is None or line_num + offset < 0:
+            return -1  # 0 is the line before the first, which a accepts.
+        return line_num + offset
+
+    def resolve(self, command):
+        """
+        Work out the line numbers of a compiled command's addresses.
+        Return address range, command, and parameter like parse().
+        """
+        if command.cmd is None:
+            return None, None, None, None
+        start = stop = None
+        if command.first is not None:
+            start = self._line(command.first)
+            if command.separator == ";" and start > 0:
+                self._current_line = start  # The second address follows from here.
+        if command.second is not None:
+            stop = self._line(command.second)
+        param = command.param
+        if param == ".":
             param = self._current_line
         elif param == "$":
             param = len(self._buffer)
+        return start, stop, command.cmd, param
 
-        return addr1, addr2, cmd, param
+    def parse(self, cmd_string):
+        """
+        Split a command string into address range, command, and parameter.
+        """
+        command = self._command
+        if command is None:
+            command = self._command = Command()
+        if command.text != cmd_string:  # Typing the same thing again is common (>).
+            self.compile(cmd_string, command)
+        return self.resolve(command)
+
+    def _get_cmd_functions(self):
+        """
+        Return the table of command characters and the methods they run.
+        """
+        cmd_functions = getattr(self, "_cmd_functions", None)
+        if cmd_functions is None:
+            cmd_functions = {
+                "=": self.show_line_number,
+                "a": self.append,
+                "c": self.change,
+                "d": self.delete,
+                "e": self.edit,
+                "E": self.edit_unconditional,
+                "f": self.file,
+                "g": self.global_cmd,
+                "h": self.help,
+                "H": self.toggle_verbosity,
+                "i": self.insert,
+                "j": self.join,
+                "k": self.mark,
+                "m": self.move,
+                "n": self.number,
+                "p": self.print,
+                "q": self.quit,
+                "Q": self.quit_unconditional,
+                "s": self.substitute,
+                "S": self.sort_range,
+                "t": self.transfer,
+                "u": self.undo_change,
+                "U": self.redo_change,
+                "v": self.global_inverse,
+                "w": self.write,
+            }
+            self._cmd_functions = cmd_functions
+        return cmd_functions
+
+    def run_command(self, cmd_string):
+        """
+        Parse and carry out one command, given as a string or as a Command
+        that was compiled earlier.
+        """
+        cmd_functions = self._get_cmd_functions()
+        if isinstance(cmd_string, Command):
+            addr1, addr2, cmd, param = self.resolve(cmd_string)
+        else:
+            addr1, addr2, cmd, param = self.parse(cmd_string)
+        if cmd not in cmd_functions:
+            self.output.write("Unrecognized cmd. Try h for help.\n")
+            return False
+        result = cmd_functions[cmd](start=addr1, stop=addr2, param=param)
+        if result is False:
+            self.output.write("Bad address range.\n")
+        return result
 
     def begin(self):
         """
         Use interactive commands to modify the text buffer.
         """
-        cmd_functions = {
-            "=": self.show_line_number,
-            "a": self.append,
-            "c": self.change,
-            "d": self.delete,
-            "e": self.edit,
-            "E": self.edit_unconditional,
-            "f": self.file,
-            "h": self.help,
-            "H": self.toggle_verbosity,
-            "i": self.insert,
-            "j": self.join,
-            "m": self.move,
-            "n": self.number,
-            "p": self.print,
-            "q": self.quit,
-            "Q": self.quit_unconditional,
-            "t": self.transfer,
-            "w": self.write,
-        }
-
         self._current_line = len(self._buffer)
 
         while True:
             cmd_string = input(self.cmd_prompt)
-            addr1, addr2, cmd, param = self.parse(cmd_string)
-            if cmd not in cmd_functions:
-                stdout.write("Unrecognized cmd. Try h for help.\n")
-            else:
-                result = cmd_functions[cmd](start=addr1, stop=addr2, param=param)
-                if result is False:
-                    stdout.write("Bad address range.\n")
-
-
-def atto(filename=None):
-    editor = Atto(filename)
-    editor.begin()
+            if cmd_string not in ("u", "U"):
+                self.checkpoint()  # Each command is undone as a whole.
+            self.run_command(cmd_string)
+
+    def run_script(self, script, write=True):
+        """
+        Run commands without prompting or showing any output. The script
+        can be a list of command strings, an open file or stream, or the
+        name of a file to read them from. Text for a, i and c is taken
+        from the lines that follow, up to a single '.', as it would be
+        typed. q or Q ends the script early, and q! ends it without
+        saving. Otherwise, if the buffer has changed and write is True,
+        it is saved once at the end.
+
+        Return a list of (line number in script, command) for commands
+        that failed.
+        """
+        if isinstance(script, str):
+            with open(script) as f:
+                return self.run_script(f, write)
+
+        failed = []
+        output, verbose = self.output, self.verbose
+        self.output = _Quiet()
+        self.verbose = False
+        self._script = iter(script)
+        self._script_line = 0
+        self._script_end = None
+        self._current_line = len(self._buffer)
+        try:
+            while True:
+                cmd_string = self._read_line(self.cmd_prompt)
+                if cmd_string is None:
+                    break
+                script_line = self._script_line
+                if cmd_string not in ("u", "U"):
+                    self.checkpoint()
+                if self.run_command(cmd_string) is False:
+                    failed.append((script_line, cmd_string))
+                if self._script_end is not None:
+                    break
+            self.checkpoint()
+            if self._script_end == "!":
+                write = False
+            if write is True and self._is_dirty is True and self.filename:
+                if self.save(self.filename) is False:
+                    failed.append((self._script_line, "w"))
+        finally:
+            self._script = None
+            self.output, self.verbose = output, verbose
+        return failed
+
+
+def atto(filename=None, storage=list, paged=False, cache_index=False, script=None):
+    if script is None:
+        Atto(filename, storage, paged, cache_index).begin()
+        return None
+    editor = Atto(None, storage, paged, cache_index)
+    editor.verbose = False  # Scripts are silent, loading the file included.
+    if filename is not None:
+        editor.load(filename)
+        editor.filename = filename
+    return editor.run_script(script)
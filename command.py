@@ -1,57 +1,594 @@
+"""
+Shell-like commands for the REPL, meant to be used with
+`from command import *`.
+"""
+
+import gc
 import os
+from external_sort import sort_lines, uniq_lines
 from time import localtime
-from re import search
-from sys import stdin
+from regex_cache import get_regex
+from sys import stdin, stdout
+
+
+# Helper functions for cat() to stream files through one reusable buffer
+min_chunk = 256  # smallest read when RAM is tight
+max_chunk = 4096  # largest read, no matter how much RAM is free
+
+
+def _chunk_size():
+    """
+    Pick a read size that fits comfortably in free RAM.
+    """
+    try:
+        free = gc.mem_free()
+    except AttributeError:  # CPython has no mem_free(), but plenty of RAM
+        return max_chunk
+    return max(min_chunk, min(max_chunk, free // 16 & ~63))
+
+
+def _tail_offset(file, lines, block_size):
+    """
+    Return the position in a binary file where its last few lines start,
+    reading backwards from the end a block at a time.
+    """
+    end = file.seek(0, 2)
+    position = end
+    found = 0
+    while position > 0 and lines > 0:
+        size = min(block_size, position)
+        position -= size
+        file.seek(position)
+        block = file.read(size)
+        i = len(block)
+        while True:
+            i = block.rfind(b"\n", 0, i)
+            if i == -1:
+                break
+            if position + i == end - 1:  # Ends the last line, doesn't start one.
+                continue
+            found += 1
+            if found == lines:
+                return position + i + 1
+    return 0 if lines > 0 else end
+
+
+def _copy_file(file, output, buffer, lines=None):
+    """
+    Write a binary file to output through buffer, optionally stopping
+    after a number of lines. Return the last byte written.
+    """
+    view = memoryview(buffer)
+    last = None
+    while lines != 0:
+        size = file.readinto(buffer)
+        if not size:
+            break
+        if lines is not None:
+            block = bytes(view[:size])
+            found = block.find(b"\n")
+            while found != -1:
+                lines -= 1
+                if lines == 0:
+                    size = found + 1
+                    break
+                found = block.find(b"\n", found + 1)
+        output.write(view[:size])
+        last = buffer[size - 1]
+    return last
+
+
+# Helper functions for walking directories and matching file names
+def _ilistdir(path="."):
+    """
+    Yield (name, type, inode, size) for each entry in a directory, the
+    same as os.ilistdir(). Falls back to listdir and stat where there is
+    no ilistdir.
+    """
+    if hasattr(os, "ilistdir"):
+        yield from os.ilistdir(path)
+        return
+    for name in os.listdir(path):
+        properties = os.stat(_join(path, name))
+        yield name, properties[0] & 0xF000, properties[1], properties[6]
+
+
+def _join(path, name):
+    return path + name if path.endswith("/") else path + "/" + name
+
+
+def _is_dir(path):
+    try:
+        return os.stat(path)[0] & 0x4000 != 0
+    except OSError:
+        return False
+
+
+def _is_glob(path):
+    return "*" in path or "?" in path
+
+
+def _fnmatch(name, pattern):
+    """
+    Match a file name against a shell wildcard pattern using * and ?.
+    """
+    n = p = 0
+    star = -1
+    mark = 0
+    while n < len(name):
+        if p < len(pattern) and (pattern[p] == "?" or pattern[p] == name[n]):
+            n += 1
+            p += 1
+        elif p < len(pattern) and pattern[p] == "*":
+            star = p
+            mark = n
+            p += 1
+        elif star != -1:  # Let the last * swallow one more character.
+            p = star + 1
+            mark += 1
+            n = mark
+        else:
+            return False
+    while p < len(pattern) and pattern[p] == "*":
+        p += 1
+    return p == len(pattern)
+
+
+def _walk(top, topdown=True):
+    """
+    Yield (path, is_dir, size) for everything under a directory, but not
+    the directory itself. Directories still to visit are kept in a list
+    instead of recursing, so deep trees don't run out of stack. Top down
+    lists a directory before its contents. Bottom up lists it after, and
+    reads each directory in full first so its entries can be removed.
+    """
+    pending = [(top, False)]
+    while pending:
+        dirname, visited = pending.pop()
+        if visited:
+            yield dirname, True, 0
+            continue
+        if topdown is True:
+            entries = _ilistdir(dirname)
+        else:
+            entries = list(_ilistdir(dirname))
+            if dirname != top:
+                pending.append((dirname, True))
+        for entry in entries:
+            path = _join(dirname, entry[0])
+            if entry[1] & 0x4000:
+                if topdown is True:
+                    yield path, True, 0
+                pending.append((path, False))
+            else:
+                size = entry[3] if len(entry) > 3 and entry[3] >= 0 else -1
+                if size == -1:
+                    size = os.stat(path)[6]
+                yield path, False, size
+
+
+def _glob(path):
+    """
+    Yield (name, is_dir) for entries matching a wildcard pattern. A path
+    that isn't a pattern is passed through with is_dir as None.
+    """
+    if not _is_glob(path):
+        yield path, None
+        return
+    slash = path.rfind("/")
+    dirname = path[:slash] if slash > 0 else ("/" if slash == 0 else ".")
+    pattern = path[slash + 1 :]
+    for entry in _ilistdir(dirname):
+        if _fnmatch(entry[0], pattern):
+            name = entry[0] if slash == -1 else _join(dirname, entry[0])
+            yield name, entry[1] & 0x4000 != 0
+
+
+def _expand_paths(paths, recursive=False):
+    """
+    Yield file names for a list of files, wildcard patterns and (when
+    recursive) directories.
+    """
+    for path in paths:
+        for name, is_dir in _glob(path):
+            if is_dir is None:
+                try:
+                    is_dir = os.stat(name)[0] & 0x4000 != 0
+                except OSError:
+                    print("File not found:", name)
+                    continue
+            if not is_dir:
+                yield name
+            elif recursive is True:
+                for entry_path, entry_is_dir, size in _walk(name):
+                    if not entry_is_dir:
+                        yield entry_path
+            elif name == path:  # Named outright, not matched by a pattern
+                print("Is a directory:", name)
+
+
+def _find(path, name, type):
+    for entry_path, is_dir, size in _walk(path):
+        if type == "f" and is_dir or type == "d" and not is_dir:
+            continue
+        if name is None or _fnmatch(entry_path[entry_path.rfind("/") + 1 :], name):
+            yield entry_path
+
+
+def _copy_path(src_path, dest_path, buffer):
+    with open(src_path, "rb") as src, open(dest_path, "wb") as dest:
+        _copy_file(src, dest, buffer)
+
+
+def _exists(path):
+    try:
+        os.stat(path)
+    except OSError:
+        return False
+    return True
+
 
+def _remove_tree(path):
+    """
+    Delete a directory and everything in it, deepest entries first.
+    """
+    for entry_path, is_dir, size in _walk(path, topdown=False):
+        if is_dir:
+            os.rmdir(entry_path)
+        else:
+            os.remove(entry_path)
+    os.rmdir(path)
+
+
+# Helper functions for ls() to list directories in a single pass
+_months = (
+    "Jan",
+    "Feb",
+    "Mar",
+    "Apr",
+    "May",
+    "Jun",
+    "Jul",
+    "Aug",
+    "Sep",
+    "Oct",
+    "Nov",
+    "Dec",
+)
+max_dates = 32  # formatted modification times kept between rows
+_dates = {}
+
+
+def _short_date(seconds):
+    """
+    Return date(seconds, short=True, pipe=True), remembering recent
+    results since files in a directory often share a modification time.
+    """
+    minute = seconds // 60  # Short dates don't show seconds.
+    text = _dates.get(minute)
+    if text is None:
+        if len(_dates) >= max_dates:
+            _dates.clear()
+        text = date(seconds, short=True, pipe=True)
+        _dates[minute] = text
+    return text
+
+
+def _list_dir(path, recursive=False):
+    """
+    Yield [name, path, is_dir, size, stat] for directory entries. The
+    size is -1 if ilistdir doesn't give one, and the stat is None until
+    something needs it. Subdirectories are visited from a list instead
+    of by recursion.
+    """
+    pending = [""]
+    while pending:
+        subdir = pending.pop()
+        dirname = _join(path, subdir) if subdir else path
+        for entry in _ilistdir(dirname):
+            name = subdir + "/" + entry[0] if subdir else entry[0]
+            is_dir = entry[1] & 0x4000 != 0
+            if recursive is True and is_dir:
+                pending.append(name)
+            size = entry[3] if len(entry) > 3 else -1
+            yield [name, _join(dirname, entry[0]), is_dir, size, None]
+
+
+def _entry_stat(entry):
+    if entry[4] is None:
+        entry[4] = os.stat(entry[1])
+    return entry[4]
+
+
+def _size_key(entry):
+    if entry[2]:
+        return 0
+    return entry[3] if entry[3] >= 0 else _entry_stat(entry)[6]
+
+
+def _time_key(entry):
+    return _entry_stat(entry)[8]
+
+
+def _name_key(entry):
+    return entry[0]
+
+
+def _sort_entries(entries, sort, reverse):
+    if sort == "size":
+        key = _size_key
+    elif sort == "time":
+        key = _time_key
+    else:
+        key = _name_key
+    entries.sort(key=key, reverse=reverse)
+    return entries
+
+
+def _ls_rows(entries, long):
+    for entry in entries:
+        name, is_dir = entry[0], entry[2]
+        if long is False:
+            yield name + "/" if is_dir else name
+            continue
+        properties = _entry_stat(entry)
+        if is_dir:
+            type = "d"
+            size = 0
+        else:
+            type = "-"
+            size = properties[6]
+        mtime = _short_date(properties[8])
+        yield "{} {:10d}  {:>11s}  {}".format(type, size, mtime, name)
+
+
+# Helper functions for grep() and pipelines to read lines a block at a time
+def _read_lines(filename, block_size=512, start=0):
+    """
+    Yield the lines of a file as bytes, without line endings. The file
+    is read in fixed size blocks, so only a block and a line are in RAM.
+    """
+    with open(filename, "rb") as f:
+        if start:
+            f.seek(start)
+        rest = b""
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            if rest:
+                block = rest + block
+            start = 0
+            found = block.find(b"\n")
+            while found != -1:
+                yield block[start:found].rstrip(b"\r")
+                start = found + 1
+                found = block.find(b"\n", start)
+            rest = block[start:]
+        if rest:
+            yield rest.rstrip(b"\r")
+
+
+def _text_lines(filename, start=0):
+    """
+    Yield (line number, text) for each line of a file that decodes as
+    text. Binary junk is skipped.
+    """
+    line_num = 0
+    for line in _read_lines(filename, start=start):
+        line_num += 1
+        try:
+            yield line_num, line.decode()
+        except UnicodeError:
+            continue
+
+
+def _match_lines(regex, numbered_lines, prefix, count, line_numbers, max_count):
+    matches = 0
+    for line_num, text in numbered_lines:
+        if max_count is not None and matches >= max_count:
+            break
+        if regex.search(text) is None:
+            continue
+        matches += 1
+        if count is False:
+            if line_numbers is True:
+                yield "{}{}:{}".format(prefix, line_num, text)
+            else:
+                yield prefix + text
+    if count is True:
+        yield prefix + str(matches)
 
-# Helper function for cat() to avoid eating RAM with big buffers
-def _read_file_chunk(file):
-    while True:
-        chunk = file.read(64)  # small chunks to avoid out of memory errors
-        if chunk:
-            yield chunk
-        else:  # empty chunk means end of the file
-            return
+
+def _grep(regex, paths, recursive, count, line_numbers, max_count):
+    show_names = recursive is True or len(paths) > 1 or _is_glob(paths[0])
+    for filename in _expand_paths(paths, recursive):
+        prefix = filename + ":" if show_names else ""
+        yield from _match_lines(
+            regex, _text_lines(filename), prefix, count, line_numbers, max_count
+        )
+
+
+def _cat_lines(file_list, head, tail):
+    for filename in _expand_paths(file_list):
+        start = 0
+        if tail is not None:
+            with open(filename, "rb") as f:
+                start = _tail_offset(f, tail, 512)
+        for line_num, text in _text_lines(filename, start):
+            if head is not None and line_num > head:
+                break
+            yield text
+
+
+# Helper function for recv() to take files in checksummed blocks
+def _recv_blocks(filename, resume):
+    """
+    Receive a file sent by tools/send.py. Each block arrives on a line of
+    its own as 'OFFSET CRC32 BASE64DATA' and is answered with 'OK NEXT'
+    or 'NAK NEXT', where NEXT is the offset wanted next. The last line is
+    'END SIZE CRC32' for the whole file. Running out of input before
+    then fails the transfer.
+    """
+    from binascii import a2b_base64, crc32  # Only needed here.
+
+    position = 0
+    crc = 0
+    if resume is True:
+        try:
+            with open(filename, "rb") as f:
+                while True:
+                    block = f.read(512)
+                    if not block:
+                        break
+                    crc = crc32(block, crc)
+                    position += len(block)
+        except OSError:
+            pass
+
+    with open(filename, "ab" if position else "wb") as f:
+        print("RDY", position)
+        while True:
+            line = stdin.readline()
+            if not line:  # End of input, so the rest is never coming.
+                fields = []
+                break
+            fields = line.split()
+            if not fields:
+                continue
+            if fields[0] == "END" or fields[0] == "ABORT":
+                break
+            try:
+                offset = int(fields[0])
+                block_crc = int(fields[1], 16)
+                data = a2b_base64(fields[2])
+            except (IndexError, ValueError):
+                offset = -1
+            if offset != position or crc32(data) & 0xFFFFFFFF != block_crc:
+                print("NAK", position)
+                continue
+            f.write(data)
+            position += len(data)
+            crc = crc32(data, crc)
+            print("OK", position)
+
+    crc &= 0xFFFFFFFF
+    try:
+        if (
+            len(fields) == 3
+            and int(fields[1]) == position
+            and int(fields[2], 16) == crc
+        ):
+            print("DONE", position)
+            return True
+    except ValueError:
+        pass
+    print("FAIL", position)
+    return False
+
+
+# Pipeline stages, for use with pipe()
+def to(filename, append=False, write_size=512):
+    """
+    Return a pipeline stage that writes lines to a file.
+    """
+
+    def sink(lines):
+        buffer = bytearray()
+        with open(filename, "ab" if append is True else "wb") as f:
+            for line in lines:
+                buffer.extend(line.encode())
+                buffer.extend(b"\n")
+                if len(buffer) >= write_size:
+                    f.write(buffer)
+                    buffer = bytearray()
+            if buffer:
+                f.write(buffer)
+
+    return sink
+
+
+def pipe(source, *stages):
+    """
+    Feed lines from source through each stage in turn. A source is any
+    iterable of lines, like cat(FILE, pipe=True), or a single string.
+    A stage is a function taking an iterable of lines and returning
+    another, or None when it is the end of the line, like to(FILE).
+    Lines that come out the end are printed.
+    """
+    lines = [source] if isinstance(source, str) else source
+    for stage in stages:
+        lines = stage(lines)
+    if lines is not None:
+        for line in lines:
+            print(line)
 
 
 # Functions named after their *nix shell counterparts
-def cat(*file_list):
+def cat(*file_list, head=None, tail=None, pipe=False):
     if len(file_list) == 0:
         print("Usage: cat('FILE1', [FILE2], ...)")
+    elif pipe is True:
+        return _cat_lines(file_list, head, tail)
     else:
+        output = getattr(stdout, "buffer", stdout)
+        buffer = bytearray(_chunk_size())
         for file in file_list:
             try:
                 os.stat(file)
             except OSError:
                 print("File not found:", file)
             else:
-                with open(file) as f:
-                    for chunk in _read_file_chunk(f):
-                        print(chunk, end="")
-                print()
+                if hasattr(stdout, "flush"):
+                    stdout.flush()  # Keep earlier text ahead of raw bytes.
+                with open(file, "rb") as f:
+                    if tail is not None:
+                        f.seek(_tail_offset(f, tail, len(buffer)))
+                    last = _copy_file(f, output, buffer, head)
+                if hasattr(output, "flush"):
+                    output.flush()
+                if last is not None and last != 0x0A:
+                    print()
 
 
 def cd(dirname="/"):
     os.chdir(dirname)
 
 
+def cp(src_path=None, dest_path=None, recursive=False):
+    if src_path is None or dest_path is None:
+        print("Usage: cp('SOURCE', 'DEST')")
+        return
+    src_path = src_path.rstrip("/") or "/"
+    if _is_dir(dest_path):
+        dest_path = _join(dest_path, src_path.split("/")[-1])
+    if _exists(dest_path) and not _is_dir(dest_path):
+        print("Cowardly refusing to overwrite existing file.")
+        return
+    buffer = bytearray(_chunk_size())
+    if not _is_dir(src_path):
+        _copy_path(src_path, dest_path, buffer)
+    elif recursive is False:
+        print("Is a directory:", src_path)
+    elif dest_path.startswith(src_path + "/"):
+        print("Cannot copy a directory into itself.")
+    else:
+        if not _exists(dest_path):
+            os.mkdir(dest_path)
+        for path, is_dir, size in _walk(src_path):
+            target = dest_path + path[len(src_path) :]
+            if is_dir:
+                if not _exists(target):
+                    os.mkdir(target)
+            elif _exists(target):
+                print("Cowardly refusing to overwrite existing file:", target)
+            else:
+                _copy_path(path, target, buffer)
+
+
 def date(seconds=None, short=False, pipe=False):
-    months = [
-        "Jan",
-        "Feb",
-        "Mar",
-        "Apr",
-        "May",
-        "Jun",
-        "Jul",
-        "Aug",
-        "Sep",
-        "Oct",
-        "Nov",
-        "Dec",
-    ]
     datetime = localtime(seconds)
-    month = months[datetime[1] - 1]
+    month = _months[datetime[1] - 1]
     day = datetime[2]
     day_space = " " if day < 10 else ""
     year = datetime[0]
@@ -90,46 +627,88 @@ def df(path="."):
     )
 
 
-def grep(pattern=None, filename=None):
-    if pattern is None or filename is None:
-        print("Usage: grep('PATTERN', 'FILENAME')")
+def du(path=".", summarize=False):
+    """
+    Show how much space each directory uses, in kilobytes, counting
+    everything under it.
+    """
+    path = path.rstrip("/") or "/"  # Entries' parents never end in /.
+    totals = {path: 0}
+    for entry_path, is_dir, size in _walk(path, topdown=False):
+        parent = entry_path[: entry_path.rfind("/")] or "/"
+        if is_dir:
+            size = totals.pop(entry_path, 0)
+            if summarize is False:
+                print("{:8d}K  {}".format((size + 1023) // 1024, entry_path))
+        totals[parent] = totals.get(parent, 0) + size
+    print("{:8d}K  {}".format((totals[path] + 1023) // 1024, path))
+
+
+def find(path=".", name=None, type=None, pipe=False):
+    results = _find(path, name, type)
+    if pipe is True:
+        return results
+    for result in results:
+        print(result)
+
+
+def grep(
+    pattern=None,
+    *paths,
+    filename=None,
+    recursive=False,
+    count=False,
+    line_numbers=False,
+    max_count=None,
+    pipe=False
+):
+    if filename is not None:  # The old grep('PATTERN', filename='FILE') form
+        paths += (filename,)
+    if pattern is None or (len(paths) == 0 and pipe is False):
+        print("Usage: grep('PATTERN', 'FILE1', [FILE2], ...)")
+    elif len(paths) == 0:  # No files, so filter lines in a pipeline.
+        regex = get_regex(pattern)
+
+        def stage(lines):
+            numbered_lines = enumerate(lines, 1)
+            return _match_lines(
+                regex, numbered_lines, "", count, line_numbers, max_count
+            )
+
+        return stage
     else:
-        with open(filename) as file:
-            while True:
-                line = file.readline()
-                if not line:
-                    break
-                search_result = search(pattern, line)
-                if search_result is not None:
-                    print(line.rstrip("\r\n"))
+        results = _grep(
+            get_regex(pattern), paths, recursive, count, line_numbers, max_count
+        )
+        if pipe is True:
+            return results
+        for result in results:
+            print(result)
 
 
-def ls(path="."):
+def ls(path=".", long=True, recursive=False, sort=None, reverse=False, pipe=False):
     try:
-        is_dir = True if os.stat(path)[0] & 0x4000 else False
+        properties = os.stat(path)
     except OSError:
         print("No such file or directory.")
     else:
-        if is_dir is True:
-            parent = path + "/"
-            list = os.listdir(path)
+        if properties[0] & 0x4000:
+            entries = _list_dir(path, recursive)
         else:
-            parent = ""
-            list = [path]
-
-        print("total", len(list))
-        if len(list) != 0:
+            entries = iter([[path, path, False, properties[6], properties]])
+        if sort is not None or reverse is True:
+            entries = _sort_entries(list(entries), sort, reverse)
+        rows = _ls_rows(entries, long)
+        if pipe is True:
+            return rows
+
+        if long is True:
             print("Type    Size  MTime         Name")
-            for entry in list:
-                properties = os.stat(parent + entry)
-                if properties[0] & 0x4000:  # entry is a directory
-                    type = "d"
-                    size = 0
-                else:
-                    type = "-"
-                    size = properties[6]
-                mtime = date(properties[8], short=True, pipe=True)
-                print("{} {:10d}  {:>11s}  {}".format(type, size, mtime, entry))
+        total = 0
+        for row in rows:
+            print(row)
+            total += 1
+        print("total", total)
 
 
 def mkdir(dirname=None):
@@ -159,7 +738,9 @@ def pwd():
     print(os.getcwd())
 
 
-def recv(filename="recv.txt", eof_marker="EOF"):
+def recv(filename="recv.txt", eof_marker="EOF", binary=False, resume=False):
+    if binary is True:
+        return _recv_blocks(filename, resume)
     with open(filename, "wb") as f:
         num_lines = 0
         eof = None
@@ -173,15 +754,19 @@ def recv(filename="recv.txt", eof_marker="EOF"):
                 num_lines += 1
 
 
-def rm(filename=None):
+def rm(filename=None, recursive=False):
     if filename is None:
         print("Usage: rm('FILENAME')")
-    elif filename == "*":
-        dir_list = os.listdir()
-        for file in dir_list:
-            os.remove(file)
     else:
-        os.remove(filename)
+        for name, is_dir in list(_glob(filename)):  # Listed before deleting.
+            if is_dir is None:
+                is_dir = _is_dir(name)
+            if not is_dir:
+                os.remove(name)
+            elif recursive is True:
+                _remove_tree(name)
+            else:
+                print("Is a directory:", name)
 
 
 def rmdir(dirname=None):
@@ -218,9 +803,57 @@ def select(*args, title=None, prompt="#? "):
     return choice
 
 
+def sort(*file_list, reverse=False, numeric=False, unique=False, pipe=False):
+    """
+    Sort the lines of files together. Files too big to sort in RAM are
+    sorted in pieces, using temporary files in the current directory.
+    """
+    if len(file_list) == 0 and pipe is False:
+        print("Usage: sort('FILE1', [FILE2], ...)")
+        return None
+    if len(file_list) == 0:  # No files, so sort lines in a pipeline.
+
+        def stage(lines):
+            return sort_lines(lines, reverse, numeric, unique)
+
+        return stage
+    results = sort_lines(_cat_lines(file_list, None, None), reverse, numeric, unique)
+    if pipe is True:
+        return results
+    for result in results:
+        print(result)
+
+
+def stats(dump=None, clear=False):
+    """
+    Show the measurements taken by instrument.py. It is imported only
+    when asked for, so nothing is loaded unless measuring is used.
+    """
+    import instrument
+
+    instrument.stats(dump, clear)
+
+
 def touch(filename=None):
     if filename is None:
         print("Usage: touch('FILENAME')")
     else:
         file = open(filename, "w")
         file.close()
+
+
+def uniq(*file_list, count=False, pipe=False):
+    if len(file_list) == 0 and pipe is False:
+        print("Usage: uniq('FILE1', [FILE2], ...)")
+        return None
+    if len(file_list) == 0:  # No files, so filter lines in a pipeline.
+
+        def stage(lines):
+            return uniq_lines(lines, count)
+
+        return stage
+    results = uniq_lines(_cat_lines(file_list, None, None), count)
+    if pipe is True:
+        return results
+    for result in results:
+        print(result)
@@ -0,0 +1,182 @@
+import gc
+import os
+
+# Lines that fit in RAM are sorted there. Bigger inputs are cut into sorted
+# runs written to flash and merged back together a few runs at a time.
+line_overhead = 24  # rough bytes of RAM per line on top of its text
+max_open = 6  # runs merged at once, each needs an open file
+write_lines = 32  # lines gathered into each write to a run file
+_next_run = 0  # number for the next run file, across all sorts
+
+
+def _run_filename(temp_dir):
+    """
+    Return the name of a run file in temp_dir that doesn't exist yet.
+    Numbers keep counting up from one sort to the next, so sorts running
+    at the same time never share a file, and files already there are
+    never overwritten.
+    """
+    global _next_run
+    while True:
+        filename = "{}/sort{:d}.tmp".format(temp_dir, _next_run)
+        _next_run += 1
+        try:
+            os.stat(filename)
+        except OSError:
+            return filename
+
+
+def _run_budget():
+    """
+    Return how many bytes of lines to sort in RAM before starting a run.
+    """
+    try:
+        return max(gc.mem_free() // 4, 4096)
+    except AttributeError:  # CPython has no mem_free(), but plenty of RAM
+        return 1024 * 1024
+
+
+def _numeric_key(line):
+    """
+    Sort key for sort -n: the number at the start of the line, or 0.
+    """
+    text = line.lstrip()
+    end = 0
+    while end < len(text) and text[end] in "+-.0123456789":
+        end += 1
+    try:
+        return float(text[:end])
+    except ValueError:
+        return 0.0
+
+
+def _dedupe(lines):
+    previous = None
+    for line in lines:
+        if line != previous:
+            yield line
+        previous = line
+
+
+def _write_run(filename, lines):
+    with open(filename, "w") as f:
+        batch = []
+        for line in lines:
+            batch.append(line)
+            if len(batch) == write_lines:
+                f.write("\n".join(batch) + "\n")
+                batch = []
+        if batch:
+            f.write("\n".join(batch) + "\n")
+
+
+def _merge(filenames, key, reverse):
+    """
+    Yield lines from sorted run files in order. With only a handful of
+    runs, picking the next line by comparing each run's head is as quick
+    as a heap and makes reverse order easy.
+    """
+    files = [open(filename) for filename in filenames]
+    try:
+        heads = []
+        keys = []
+        for f in files:
+            line = f.readline()
+            heads.append(line[:-1] if line else None)
+            keys.append(None if not line or key is None else key(heads[-1]))
+        while True:
+            best = -1
+            for i in range(len(files)):
+                if heads[i] is None:
+                    continue
+                if best == -1:
+                    best = i
+                    continue
+                this_key = heads[i] if key is None else keys[i]
+                best_key = heads[best] if key is None else keys[best]
+                if (this_key > best_key) if reverse else (this_key < best_key):
+                    best = i
+            if best == -1:
+                return
+            yield heads[best]
+            line = files[best].readline()
+            heads[best] = line[:-1] if line else None
+            if line and key is not None:
+                keys[best] = key(heads[best])
+    finally:
+        for f in files:
+            f.close()
+
+
+def sort_lines(
+    lines, reverse=False, numeric=False, unique=False, max_bytes=None, temp_dir="."
+):
+    """
+    Yield lines in sorted order. Input that fits in max_bytes of RAM
+    (by default a quarter of free RAM) is sorted in memory. Anything
+    bigger is sorted in runs saved to temporary files in temp_dir,
+    which are merged back together and removed afterwards.
+    """
+    key = _numeric_key if numeric is True else None
+    budget = max_bytes or _run_budget()
+    runs = []
+    try:
+        chunk = []
+        size = 0
+        for line in lines:
+            chunk.append(line)
+            size += len(line) + line_overhead
+            if size > budget:
+                chunk.sort(key=key, reverse=reverse)
+                filename = _run_filename(temp_dir)
+                _write_run(filename, _dedupe(chunk) if unique is True else chunk)
+                runs.append(filename)
+                chunk = []
+                size = 0
+                gc.collect()
+
+        chunk.sort(key=key, reverse=reverse)
+        if not runs:
+            yield from _dedupe(chunk) if unique is True else chunk
+            return
+        if chunk:
+            filename = _run_filename(temp_dir)
+            _write_run(filename, chunk)
+            runs.append(filename)
+        chunk = None
+        gc.collect()
+
+        while len(runs) > max_open:
+            filename = _run_filename(temp_dir)
+            _write_run(filename, _merge(runs[:max_open], key, reverse))
+            for merged in runs[:max_open]:
+                os.remove(merged)
+            runs = runs[max_open:] + [filename]
+
+        merged = _merge(runs, key, reverse)
+        yield from _dedupe(merged) if unique is True else merged
+    finally:
+        for filename in runs:
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+
+
+def uniq_lines(lines, count=False):
+    """
+    Yield lines with adjacent duplicates removed, or with count=True,
+    each line once prefixed by how many times it repeated.
+    """
+    previous = None
+    repeats = 0
+    for line in lines:
+        if line == previous:
+            repeats += 1
+            continue
+        if repeats > 0:
+            yield "{:7d} {}".format(repeats, previous) if count is True else previous
+        previous = line
+        repeats = 1
+    if repeats > 0:
+        yield "{:7d} {}".format(repeats, previous) if count is True else previous
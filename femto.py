@@ -1,36 +1,93 @@
-from sys import stdout, exit
-from ansi import ANSI
+from sys import exit
+from ansi import ANSI, Screen
+from highlight import Highlighter, KEYWORD, STRING, COMMENT, NUMBER
+from layout import Layout
 from text_buffer import TextBuffer
 
 
+class Viewport:
+    """
+    Map screen rows to buffer lines. Rows top_row..bottom_row show the
+    buffer from top_line down, with each line starting at character left.
+    The cursor is at line, col in the buffer, both counting from 1.
+    """
+
+    def __init__(self, top_row, bottom_row, cols):
+        self.top_row = top_row
+        self.bottom_row = bottom_row
+        self.cols = cols
+        self.top_line = 1
+        self.left = 0
+        self.line = 1
+        self.col = 1
+        self.goal_col = 1  # Where up and down try to put the cursor.
+
+    def height(self):
+        return self.bottom_row - self.top_row + 1
+
+    def row(self, line_num):
+        """
+        Return the screen row showing line_num, or None if it's off screen.
+        """
+        row = self.top_row + line_num - self.top_line
+        if row < self.top_row or row > self.bottom_row:
+            return None
+        return row
+
+    def cursor(self):
+        """
+        Return the screen (row, col) of the cursor.
+        """
+        return self.top_row + self.line - self.top_line, self.col - self.left
+
+    def follow(self):
+        """
+        Move the view so the cursor is on screen. Return how many lines
+        the view moved down (negative for up) and True if it moved sideways.
+        """
+        top_line = self.top_line
+        if self.line < self.top_line:
+            self.top_line = self.line
+        elif self.line >= self.top_line + self.height():
+            self.top_line = self.line - self.height() + 1
+        left = self.left
+        if self.col <= self.left or self.col - self.left > self.cols:
+            self.left = max(self.col - self.cols // 2, 0)
+        return self.top_line - top_line, self.left != left
+
+
 class Femto(TextBuffer):
     KEY_CTRL_N = 0x0E
     KEY_CTRL_R = 0x12
     KEY_CTRL_W = 0x17
     KEY_CTRL_X = 0x18
+    KEY_CTRL_Y = 0x19
+    KEY_CTRL_Z = 0x1A
+    KEY_BS = 0x08
+    KEY_CR = 0x0D
+    KEY_DEL = 0x7F  # What most terminals send for backspace
+
+    wrap_lines = False  # Wrap long lines instead of scrolling sideways.
+    syntax_colors = {  # (style, foreground, background) for Python files
+        KEYWORD: (ANSI.BOLD, ANSI.YELLOW, ANSI.BLACK),
+        STRING: (ANSI.NORMAL, ANSI.GREEN, ANSI.BLACK),
+        COMMENT: (ANSI.NORMAL, ANSI.CYAN, ANSI.BLACK),
+        NUMBER: (ANSI.NORMAL, ANSI.MAGENTA, ANSI.BLACK),
+    }
+    highlighter = None
 
     def _set_title(self, msg):
         """
         Show message on the top line in dimmed color.
         """
-        self.terminal.cursor.save()
         col = int((self.terminal.cols - len(msg)) / 2)
-        self.terminal.cursor.coord = (1, col)
-        self.terminal.clear_line()
-        self.terminal.style = ANSI.DIM
-        stdout.write(msg)
-        self.terminal.cursor.restore()
+        self.screen.draw(1, " " * max(col - 1, 0) + msg, ANSI.DIM)
 
     def _set_status(self, msg):
         """
         Show message on the bottom line in dimmed color.
         """
-        self.terminal.cursor.save()
-        self.terminal.cursor.coord = (self.terminal.lines, 0)
-        self.terminal.clear_line()
-        self.terminal.style = ANSI.DIM
-        stdout.write(msg)
-        self.terminal.cursor.restore()
+        self.screen.draw(self.terminal.lines, msg, ANSI.DIM)
 
     def _get_input(self, prompt):
         """
@@ -40,49 +97,244 @@ class Femto(TextBuffer):
         self.terminal.cursor.coord = (self.terminal.lines, 1)
         self.terminal.clear_line()
         self.terminal.style = ANSI.BOLD
-        stdout.write(prompt)
+        self.terminal.write(prompt)
         self.terminal.style = ANSI.NORMAL
         reply = input()
+        self.screen.invalidate(self.terminal.lines)
         self.terminal.cursor.restore()
         return reply
 
     def _show_coords(self):
-        current_cursor = str(self.terminal.cursor)
-        self.terminal.cursor.save()
-        self.terminal.cursor.hide()
-        self.terminal.cursor.coord = (self.terminal.lines, self.terminal.cols - 16)
-        self.terminal.clear_line(before_cursor=False, after_cursor=True)
-        self.terminal.style = ANSI.DIM
-        stdout.write(current_cursor)
-        self.terminal.style = ANSI.NORMAL
-        self.terminal.cursor.restore()
-        self.terminal.cursor.show()
-
-    def _refresh_screen(self):
-        self.terminal.clear(clear_scrollback=True)
-        self._set_title(self.filename or "(none)")
-        self.terminal.cursor.coord = (2, 1)
-        for line_num in range(1, self.terminal.lines - 1):
-            line = self.get_line(line_num)
-            if line is not None:
-                stdout.write(line)
-                if line_num < self.terminal.lines - 2:
-                    stdout.write("\n")
-        self._set_status("[^N]ew [^R]ead [^W]rite e[^X]it")
+        coords = "Ln: {:d}, Col: {:d}".format(self.view.line, self.view.col)
+        with self.terminal.frame():
+            self.terminal.cursor.save()
+            self.terminal.cursor.hide()
+            self.terminal.cursor.coord = (self.terminal.lines, self.terminal.cols - 16)
+            self.terminal.clear_line(before_cursor=False, after_cursor=True)
+            self.terminal.style = ANSI.DIM
+            self.terminal.write(coords)
+            self.terminal.style = ANSI.NORMAL
+            self.terminal.cursor.restore()
+            self.terminal.cursor.show()
+
+    def _text_rows(self):
+        """
+        Return the first and last screen rows used for buffer text.
+        """
+        return 2, self.terminal.lines - 1
+
+    def _line_text(self, line_num):
+        """
+        Return the text of a line, or an empty string past the end.
+        """
+        text = self.get_line(line_num)
+        return "" if text is None else text
+
+    def _last_line(self):
+        return max(len(self._buffer), 1)  # An empty buffer still has a line to type on.
+
+    def _set_highlighter(self):
+        """
+        Highlight the buffer if it holds a Python file. Called whenever the
+        filename may have changed.
+        """
+        if self.highlighter is not None:
+            self._mark_lists.remove(self.highlighter)
+            self.highlighter = None
+        if self.syntax_colors and self.filename and self.filename.endswith(".py"):
+            self.highlighter = Highlighter(self)
+            self._mark_lists.append(self.highlighter)
+
+    def _spans(self, line_num, text, start, stop):
+        """
+        Return the highlights in text[start:stop], as Screen.draw() takes
+        them, or None when not highlighting.
+        """
+        if self.highlighter is None:
+            return None
+        spans = []
+        for first, last, kind in self.highlighter.spans(line_num, text):
+            if last > start and first < stop:
+                spans.append(
+                    (
+                        max(first - start, 0),
+                        min(last, stop) - start,
+                        self.syntax_colors[kind],
+                    )
+                )
+        return tuple(spans)
+
+    def _draw_line(self, line_num):
+        """
+        Draw one buffer line on its screen row, if it's on screen.
+        """
+        row = self.view.row(line_num)
+        if row is not None and self.layout is None:
+            left = self.view.left
+            stop = left + self.view.cols
+            text = self._line_text(line_num)
+            self.screen.draw(
+                row, text[left:stop], spans=self._spans(line_num, text, left, stop)
+            )
+
+    def _refresh_screen(self, full=False):
+        """
+        Bring the screen up to date with the buffer. Only the lines in view
+        are read, and only rows that have changed are sent to the terminal,
+        unless a full redraw is wanted.
+        """
+        view = self.view
+        with self.terminal.frame():
+            if full is True:
+                self.terminal.clear(clear_scrollback=True)
+                self.screen.invalidate()
+            self._set_title(self.filename or "(none)")
+            row = view.top_row
+            left = view.left
+            line_num = view.top_line
+            last_line = view.top_line + view.height() - 1
+            for line in self.get_lines(view.top_line, last_line):
+                if self.layout is None:
+                    stop = left + view.cols
+                    spans = self._spans(line_num, line, left, stop)
+                    self.screen.draw(row, line[left:stop], spans=spans)
+                    row += 1
+                    line_num += 1
+                    continue
+                for start, stop in self.layout.segments(line):
+                    if row > view.bottom_row:
+                        break
+                    spans = self._spans(line_num, line, start, stop)
+                    self.screen.draw(row, line[start:stop], spans=spans)
+                    row += 1
+                if row > view.bottom_row:
+                    break
+                line_num += 1
+            while row <= view.bottom_row:
+                self.screen.draw(row, "")
+                row += 1
+            self._set_status("[^N]ew [^R]ead [^W]rite e[^X]it")
+            self.terminal.cursor.coord = self._cursor_coord()
+            self._show_coords()
+
+    def _cursor_row(self):
+        """
+        Return the screen row the cursor line starts on, when wrapping.
+        It may be past the bottom of the screen.
+        """
+        row = self.view.top_row
+        for line in self.get_lines(self.view.top_line, self.view.line - 1):
+            row += self.layout.rows(line)
+        return row
+
+    def _cursor_coord(self):
+        """
+        Return the screen (row, col) of the cursor.
+        """
+        view = self.view
+        if self.layout is None:
+            return view.cursor()
+        line_row, col = self.layout.locate(self._line_text(view.line), view.col)
+        return min(self._cursor_row() + line_row, view.bottom_row), col
+
+    def _follow(self):
+        """
+        Move the view so the cursor is on screen. Return how many lines
+        the view moved down and True if it moved sideways. When wrapping,
+        the whole cursor line is brought into view if it fits.
+        """
+        view = self.view
+        if self.layout is None:
+            return view.follow()
+        top_line = view.top_line
+        view.follow()
+        view.left = 0
+        line_rows = self.layout.rows(self._line_text(view.line))
+        while (
+            view.top_line < view.line
+            and self._cursor_row() + line_rows - 1 > view.bottom_row
+        ):
+            view.top_line += 1
+        return view.top_line - top_line, False
+
+    def _scroll(self, direction):
+        """
+        Scroll the text area by one line (1 is forward, -1 is backward)
+        using the terminal's scroll region, then draw the one new row.
+        """
+        view = self.view
+        if direction > 0:
+            view.top_line += 1
+            self.screen.scroll_up(view.top_row, view.bottom_row)
+            self._draw_line(view.top_line + view.height() - 1)
+        else:
+            view.top_line -= 1
+            self.screen.scroll_down(view.top_row, view.bottom_row)
+            self._draw_line(view.top_line)
+
+    def _shift_rows(self, top_row, direction):
+        """
+        Move the rows from top_row to the bottom of the text area up (1) or
+        down (-1) by one, for lines joined or split above them, and draw
+        the row that opens up.
+        """
+        view = self.view
+        if self.layout is not None:
+            return  # Rows are redrawn as a whole when the cursor is placed.
+        if top_row < view.bottom_row:
+            self.terminal.scroll_region = (top_row, view.bottom_row)
+            if direction > 0:
+                self.screen.scroll_up(top_row, view.bottom_row)
+            else:
+                self.screen.scroll_down(top_row, view.bottom_row)
+            self.terminal.scroll_region = (view.top_row, view.bottom_row)
+        if direction > 0:
+            self._draw_line(view.top_line + view.height() - 1)
+        else:
+            self._draw_line(view.top_line + top_row - view.top_row)
+
+    def _place_cursor(self):
+        """
+        Scroll if the cursor has left the screen, then put it in place.
+        """
+        view = self.view
+        shift, sideways = self._follow()
+        if sideways is True or abs(shift) > 2 or self.layout is not None:
+            self._refresh_screen()
+            return
+        view.top_line -= shift  # Step back and scroll there a line at a time.
+        while shift != 0:
+            direction = 1 if shift > 0 else -1
+            self._scroll(direction)
+            shift -= direction
+        if self.highlighter is not None:
+            # An edit can change the colors of every line below it.
+            self._refresh_screen()
+            return
+        self.terminal.cursor.coord = self._cursor_coord()
         self._show_coords()
 
+    def _reset_view(self):
+        view = self.view
+        view.top_line = view.line = view.col = view.goal_col = 1
+        view.left = 0
+
     def _new_buffer_dialog(self):
         if self._buffer != "":
             prompt = "Clear buffer [y/N]? "
             confirm = self._get_input(prompt)
             if confirm == "y" or confirm == "Y":
                 self.purge()
+                self._reset_view()
             self.filename = ""
+            self._set_highlighter()
             self._refresh_screen()
 
     def _read_file_dialog(self):
         self.filename = self._get_input("Read filename: ")
         self.load(self.filename)
+        self._reset_view()
+        self._set_highlighter()
         self._refresh_screen()
 
     def _write_file_dialog(self):
@@ -96,6 +348,7 @@ class Femto(TextBuffer):
                 prompt = "Write as filename: "
                 self.filename = self._get_input(prompt)
         self.save(self.filename)
+        self._set_highlighter()
         self._refresh_screen()
 
     def _exit_dialog(self):
@@ -111,59 +364,209 @@ class Femto(TextBuffer):
                 self._refresh_screen()
                 return False
 
+    def _after_undo(self, line_num):
+        if line_num is not None:
+            view = self.view
+            view.line = min(max(line_num, 1), self._last_line())
+            view.col = min(view.col, len(self._line_text(view.line)) + 1)
+            self._follow()
+            self._refresh_screen()
+
+    def _undo_key(self):
+        self._after_undo(self.undo())
+
+    def _redo_key(self):
+        self._after_undo(self.redo())
+
+    def type_text(self, text):
+        """
+        Insert text at the cursor.
+        """
+        view = self.view
+        line = self._line_text(view.line)
+        line = line[: view.col - 1] + text + line[view.col - 1 :]
+        if view.line > len(self._buffer):
+            self.insert_line(view.line, line)
+        else:
+            self.update_line(view.line, line)
+        view.col += len(text)
+        view.goal_col = view.col
+        self._draw_line(view.line)
+        self._place_cursor()
+
+    def split_line(self):
+        """
+        Break the line at the cursor, moving the rest to a new line below.
+        """
+        view = self.view
+        line = self._line_text(view.line)
+        if view.line > len(self._buffer):
+            self.insert_line(view.line, "")
+        else:
+            self.update_line(view.line, line[: view.col - 1])
+        self.insert_line(view.line + 1, line[view.col - 1 :])
+        row = view.row(view.line)
+        if row is not None:
+            self._shift_rows(row + 1, -1)
+        self._draw_line(view.line)
+        view.line += 1
+        view.col = view.goal_col = 1
+        self._place_cursor()
+
+    def _join_lines(self, line_num):
+        """
+        Append the line after line_num to it and scroll up the rows below.
+        """
+        self.update_line(
+            line_num, self._line_text(line_num) + self._line_text(line_num + 1)
+        )
+        self.delete_line(line_num + 1)
+        row = self.view.row(line_num + 1)
+        if row is not None:
+            self._shift_rows(row, 1)
+        self._draw_line(line_num)
+
+    def delete_before(self):
+        """
+        Remove the character before the cursor (backspace), joining with
+        the line above at the start of a line.
+        """
+        view = self.view
+        if view.col > 1:
+            line = self._line_text(view.line)
+            self.update_line(view.line, line[: view.col - 2] + line[view.col - 1 :])
+            view.col -= 1
+            self._draw_line(view.line)
+        elif view.line > 1:
+            view.col = len(self._line_text(view.line - 1)) + 1
+            view.line -= 1
+            self._join_lines(view.line)
+        view.goal_col = view.col
+        self._place_cursor()
+
+    def delete_at(self):
+        """
+        Remove the character under the cursor, joining with the line below
+        at the end of a line.
+        """
+        view = self.view
+        line = self._line_text(view.line)
+        if view.col <= len(line):
+            self.update_line(view.line, line[: view.col - 1] + line[view.col :])
+            self._draw_line(view.line)
+        elif view.line < len(self._buffer):
+            self._join_lines(view.line)
+        self._place_cursor()
+
     def cursor_move(self, key_code):
-        cursor_row, cursor_col = self.terminal.cursor.coord
+        view = self.view
+        length = len(self._line_text(view.line))
         if key_code == ANSI.KEY_RIGHT:
-            cursor_col += 1
+            if view.col <= length:
+                view.col += 1
+            elif view.line < self._last_line():
+                view.line += 1
+                view.col = 1
         elif key_code == ANSI.KEY_LEFT:
-            cursor_col -= 1
-        elif key_code == ANSI.KEY_DOWN:
-            cursor_row += 1
-        elif key_code == ANSI.KEY_UP:
-            cursor_row -= 1
-        cursor_row = max(cursor_row, 2)  # Row 1 is title bar
-        cursor_row = min(cursor_row, self.terminal.lines - 1)  # Last row is status bar
-        cursor_col = max(cursor_col, 1)
-        cursor_col = min(cursor_col, self.terminal.cols)
-        self.terminal.cursor.coord = cursor_row, cursor_col
-        self._show_coords()
+            if view.col > 1:
+                view.col -= 1
+            elif view.line > 1:
+                view.line -= 1
+                view.col = len(self._line_text(view.line)) + 1
+        elif key_code == ANSI.KEY_HOME:
+            view.col = 1
+        elif key_code == ANSI.KEY_END:
+            view.col = length + 1
+        if key_code == ANSI.KEY_DOWN or key_code == ANSI.KEY_UP:
+            if key_code == ANSI.KEY_DOWN:
+                view.line = min(view.line + 1, self._last_line())
+            else:
+                view.line = max(view.line - 1, 1)
+            view.col = min(view.goal_col, len(self._line_text(view.line)) + 1)
+        else:
+            view.goal_col = view.col
+        self._place_cursor()
 
     def screen_scroll(self, key_code):
+        view = self.view
+        page_size = view.height()
         if key_code == ANSI.KEY_NPAGE:
-            self._current_line += self.terminal.lines - 2
+            view.top_line += page_size
+            view.line += page_size
         elif key_code == ANSI.KEY_PPAGE:
-            self._current_line -= self.terminal.lines - 2
-        self._current_line = max(self._current_line, 1)
-        self._current_line = min(self._current_line, len(self._buffer))
+            view.top_line -= page_size
+            view.line -= page_size
+        view.top_line = min(view.top_line, self._last_line() - page_size + 1)
+        view.top_line = max(view.top_line, 1)
+        view.line = min(max(view.line, 1), self._last_line())
+        view.col = min(view.goal_col, len(self._line_text(view.line)) + 1)
+        self._follow()
         self._refresh_screen()
-        self._show_coords()
 
-    def begin(self):
+    def _start(self):
         """
-        Navigate and edit buffer based on user input.
+        Set up the terminal and draw the first screen.
         """
         self.terminal = ANSI()
         self.terminal.echo = False
-        self.terminal.scroll_region = (2, 23)
-        self._current_line = len(self._buffer) or 1
-        self._refresh_screen()
+        top_row, bottom_row = self._text_rows()
+        self.terminal.scroll_region = (top_row, bottom_row)
+        self.screen = Screen(self.terminal)
+        self.view = Viewport(top_row, bottom_row, self.terminal.cols)
+        self.layout = Layout(self.terminal.cols) if self.wrap_lines is True else None
+        self._set_highlighter()
+        self._refresh_screen(full=True)
 
-        ctrl_key_functions = {
+        self._ctrl_key_functions = {
             Femto.KEY_CTRL_N: self._new_buffer_dialog,
             Femto.KEY_CTRL_R: self._read_file_dialog,
             Femto.KEY_CTRL_W: self._write_file_dialog,
             Femto.KEY_CTRL_X: self._exit_dialog,
+            Femto.KEY_CTRL_Y: self._redo_key,
+            Femto.KEY_CTRL_Z: self._undo_key,
         }
 
-        while True:
-            key_code = self.terminal.getch()
+    def _handle_key(self, key_code):
+        """
+        Act on one keypress. Typing and deleting add to the same undo step
+        until something else is done.
+        """
+        if key_code in self._ctrl_key_functions:
+            if key_code != Femto.KEY_CTRL_Z and key_code != Femto.KEY_CTRL_Y:
+                self.checkpoint()
+            self._ctrl_key_functions[key_code]()
+            return
+        with self.terminal.frame():  # One write to the terminal per key.
             if key_code > 0x1F and key_code < 0x7F:
-                stdout.write(chr(key_code))
-            elif key_code == ANSI.KEY_ENTER:
-                self.terminal.next_line()
-            elif key_code >= ANSI.KEY_DOWN and key_code <= ANSI.KEY_BACKSPACE:
-                self.cursor_move(key_code)
-            elif key_code == ANSI.KEY_PPAGE or key_code == ANSI.KEY_NPAGE:
-                self.screen_scroll(key_code)
-            elif key_code in ctrl_key_functions:
-                ctrl_key_functions[key_code]()
+                self.type_text(chr(key_code))
+            elif key_code == Femto.KEY_DEL or key_code == Femto.KEY_BS:
+                self.delete_before()
+            elif key_code == ANSI.KEY_DC:
+                self.delete_at()
+            else:
+                self.checkpoint()
+                if key_code == ANSI.KEY_ENTER or key_code == Femto.KEY_CR:
+                    self.split_line()
+                elif key_code >= ANSI.KEY_DOWN and key_code <= ANSI.KEY_HOME:
+                    self.cursor_move(key_code)
+                elif key_code == ANSI.KEY_END:
+                    self.cursor_move(key_code)
+                elif key_code == ANSI.KEY_PPAGE or key_code == ANSI.KEY_NPAGE:
+                    self.screen_scroll(key_code)
+
+    def begin(self):
+        """
+        Navigate and edit buffer based on user input.
+        """
+        self._start()
+        while True:
+            self._handle_key(self.terminal.getch())
+
+    async def begin_async(self):
+        """
+        Same as begin(), but waits for keys with asyncio so other tasks
+        (like a web server) keep running while the editor is idle.
+        """
+        self._start()
+        async for key_code in self.terminal:
+            self._handle_key(key_code)
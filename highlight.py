@@ -0,0 +1,191 @@
+from journal import Journal
+
+"""
+Syntax highlighting for Python, one line at a time.
+
+The only thing a line needs to know about the lines above it is whether
+it starts inside a triple-quoted string. That is kept for every line
+worked out so far, so drawing a line only lexes that line. After an edit,
+lines are re-lexed from the edit down only until a line starts in the
+same state it did before. Past that point nothing can have changed.
+"""
+
+# Line states
+CODE = 0
+IN_SINGLE = 1  # inside a ''' string
+IN_DOUBLE = 2  # inside a """ string
+
+# Kinds of span
+KEYWORD = 1
+STRING = 2
+COMMENT = 3
+NUMBER = 4
+
+keywords = set(
+    (
+        "False None True and as assert async await break class continue def"
+        " del elif else except finally for from global if import in is"
+        " lambda nonlocal not or pass raise return try while with yield"
+    ).split()
+)
+
+_triple = ("", "'''", '"""')
+_word = "0123456789_"
+_number = "0123456789._"
+
+
+def _string_end(text, pos, quote):
+    """
+    Return the position just past the closing quote of a one-line string
+    whose opening quote is before pos, or -1 if it isn't closed.
+    """
+    while pos < len(text):
+        ch = text[pos]
+        if ch == "\\":
+            pos += 2
+        elif ch == quote:
+            return pos + 1
+        else:
+            pos += 1
+    return -1
+
+
+def lex(text, state=CODE, spans=None):
+    """
+    Return the state text leaves the next line in. If spans is a list,
+    (start, stop, kind) tuples are added to it for each keyword, string,
+    comment and number.
+    """
+    pos = 0
+    length = len(text)
+    if state != CODE:
+        close = text.find(_triple[state])
+        stop = length if close == -1 else close + 3
+        if spans is not None and stop > 0:
+            spans.append((0, stop, STRING))
+        if close == -1:
+            return state
+        pos = stop
+    while pos < length:
+        ch = text[pos]
+        if ch == "#":
+            if spans is not None:
+                spans.append((pos, length, COMMENT))
+            break
+        if ch == "'" or ch == '"':
+            if text.startswith(ch * 3, pos):
+                close = text.find(ch * 3, pos + 3)
+                stop = length if close == -1 else close + 3
+                if spans is not None:
+                    spans.append((pos, stop, STRING))
+                if close == -1:
+                    return IN_SINGLE if ch == "'" else IN_DOUBLE
+            else:
+                stop = _string_end(text, pos + 1, ch)
+                if stop == -1:
+                    stop = length
+                if spans is not None:
+                    spans.append((pos, stop, STRING))
+            pos = stop
+        elif ch.isalpha() or ch == "_":
+            stop = pos + 1
+            while stop < length and (text[stop].isalpha() or text[stop] in _word):
+                stop += 1
+            if spans is not None and text[pos:stop] in keywords:
+                spans.append((pos, stop, KEYWORD))
+            pos = stop
+        elif ch.isdigit():
+            stop = pos + 1
+            while stop < length and (text[stop].isalpha() or text[stop] in _number):
+                stop += 1
+            if spans is not None:
+                spans.append((pos, stop, NUMBER))
+            pos = stop
+        else:
+            pos += 1
+    return CODE
+
+
+class Highlighter:
+    """
+    Keep the state each line of a TextBuffer starts in, so any line can
+    be lexed on its own. Add it to the buffer's _mark_lists and it is told
+    about every change, the same way marks are.
+    """
+
+    max_lines = 64  # lexed lines remembered for redrawing
+
+    def __init__(self, buffer):
+        self._buffer = buffer
+        self._states = bytearray(1)  # States worked out so far, from line 1.
+        self._valid = 1  # How many of them are known to be right.
+        self._touched = -1  # Last line changed, counting from 0.
+        self._spans = {}
+        self._order = []
+
+    def shift(self, op, start, count):
+        """
+        Account for a change, given the same way as a journal record.
+        """
+        index = start - 1
+        states = self._states
+        if index >= len(states):
+            return  # Nothing that far down has been worked out yet.
+        if self._touched != -1:
+            # An earlier change still reaches as far as lines were lexed.
+            self._touched = max(self._touched, self._valid - 1)
+        if op == Journal.INSERT:
+            # The old line keeps its old state, to compare with after lexing.
+            states[index + 1 : index + 1] = bytes([states[index]] * count)
+            if self._touched >= index:
+                self._touched += count
+            self._touched = max(self._touched, index + count - 1)
+        elif op == Journal.DELETE:
+            states[index + 1 : index + 1 + count] = b""
+            if self._touched > index:
+                self._touched = max(self._touched - count, index)
+            self._touched = max(self._touched, index)
+        else:
+            self._touched = max(self._touched, index + count - 1)
+        self._valid = min(self._valid, index + 1, len(states))
+
+    def state(self, line_num):
+        """
+        Return the state line_num starts in, lexing any lines above it
+        that changed or haven't been seen yet.
+        """
+        index = line_num - 1
+        states = self._states
+        while self._valid <= index:
+            i = self._valid - 1
+            text = self._buffer.get_line(i + 1)
+            if text is None:
+                return CODE
+            end = lex(text, states[i])
+            self._valid += 1
+            if i + 1 < len(states):
+                old = states[i + 1]
+                states[i + 1] = end
+                if i >= self._touched and old == end:
+                    self._valid = len(states)  # The rest still holds.
+                    self._touched = -1
+            else:
+                states.append(end)
+        return states[index]
+
+    def spans(self, line_num, text):
+        """
+        Return (start, stop, kind) tuples for the line's highlights.
+        """
+        state = self.state(line_num)
+        key = (text, state)
+        spans = self._spans.get(key)
+        if spans is None:
+            spans = []
+            lex(text, state, spans)
+            spans = tuple(spans)
+            self._spans[key] = spans
+            self._order.append(key)
+            if len(self._order) > self.max_lines:
+                del self._spans[self._order.pop(0)]
+        return spans
@@ -0,0 +1,212 @@
+import gc
+from array import array
+
+try:
+    from time import ticks_us, ticks_diff
+except ImportError:  # CPython
+    from time import perf_counter
+
+    def ticks_us():
+        return int(perf_counter() * 1000000)
+
+    def ticks_diff(end, start):
+        return end - start
+
+
+"""
+Opt-in timing and heap measurements for REPL Buddy operations.
+
+Nothing is measured until enable() is called. It wraps TextBuffer's
+loading, saving and editing methods, the command functions and Femto's
+screen updates. Each call adds a sample (how long it took, how much free
+heap it used up and how much was left) to a ring buffer holding only the
+most recent samples, so memory use stays fixed no matter how long it runs.
+
+Example:
+    >>> import instrument
+    >>> instrument.enable()
+    >>> from command import *
+    >>> grep('ERR', 'app.log')
+    >>> stats()
+"""
+
+buffer_methods = (
+    "load",
+    "save",
+    "insert_line",
+    "insert_lines",
+    "update_line",
+    "delete_line",
+    "delete_range",
+    "copy_range",
+    "move_range",
+    "undo",
+    "redo",
+)
+command_functions = (
+    "cat",
+    "cp",
+    "du",
+    "find",
+    "grep",
+    "ls",
+    "mv",
+    "recv",
+    "rm",
+    "run",
+    "sort",
+    "uniq",
+)
+femto_methods = ("_refresh_screen", "_scroll")
+
+
+def _mem_free():
+    try:
+        return gc.mem_free()
+    except AttributeError:  # CPython doesn't say.
+        return 0
+
+
+class Samples:
+    """
+    A ring buffer of (name, microseconds, heap used, heap free) samples.
+    Once full, each new sample replaces the oldest.
+    """
+
+    def __init__(self, size=64):
+        self._names = [None] * size
+        self._times = array("l", [0] * size)
+        self._used = array("l", [0] * size)
+        self._free = array("l", [0] * size)
+        self._next = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        """
+        Yield samples from oldest to newest.
+        """
+        size = len(self._names)
+        i = (self._next - self.count) % size
+        for _ in range(self.count):
+            yield self._names[i], self._times[i], self._used[i], self._free[i]
+            i = (i + 1) % size
+
+    def add(self, name, time_us, used, free):
+        i = self._next
+        self._names[i] = name
+        self._times[i] = time_us
+        self._used[i] = used
+        self._free[i] = free
+        self._next = (i + 1) % len(self._names)
+        if self.count < len(self._names):
+            self.count += 1
+
+    def clear(self):
+        self._next = 0
+        self.count = 0
+
+
+samples = None
+_originals = []  # (owner, attribute, original function) to put back
+
+
+def _measured(name, function):
+    """
+    Wrap function so every call adds a sample, even one that fails
+    (running out of heap is the interesting case.)
+    """
+
+    def wrapper(*args, **kwargs):
+        free = _mem_free()
+        start = ticks_us()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            elapsed = ticks_diff(ticks_us(), start)
+            free_after = _mem_free()
+            samples.add(name, elapsed, free - free_after, free_after)
+
+    return wrapper
+
+
+def _wrap(owner, prefix, names):
+    for name in names:
+        function = getattr(owner, name, None)
+        if function is not None:
+            _originals.append((owner, name, function))
+            setattr(owner, name, _measured(prefix + name, function))
+
+
+def enable(size=64, buffer=True, command=True, femto=True):
+    """
+    Start measuring, keeping the most recent size samples. Call it before
+    `from command import *`, since names imported earlier aren't wrapped.
+    """
+    global samples
+    disable()
+    samples = Samples(size)
+    # Imported here so only the parts being measured get loaded.
+    if buffer is True:
+        from text_buffer import TextBuffer
+
+        _wrap(TextBuffer, "buffer.", buffer_methods)
+    if command is True:
+        import command as command_module
+
+        _wrap(command_module, "", command_functions)
+    if femto is True:
+        from femto import Femto
+
+        _wrap(Femto, "femto.", femto_methods)
+
+
+def disable():
+    """
+    Stop measuring and put the original functions back. Samples taken so
+    far are kept for stats().
+    """
+    while _originals:
+        owner, name, function = _originals.pop()
+        setattr(owner, name, function)
+
+
+def stats(dump=None, clear=False):
+    """
+    Print recent samples, oldest first, followed by totals for each
+    operation. With dump, write the samples to that file as CSV instead.
+    """
+    if samples is None:
+        print("Not measuring. Use instrument.enable() first.")
+        return
+    if dump is not None:
+        with open(dump, "w") as f:
+            f.write("name,time_us,heap_used,heap_free\n")
+            for sample in samples:
+                f.write("{},{:d},{:d},{:d}\n".format(*sample))
+    else:
+        totals = {}
+        print("   Time us  Heap used  Heap free  Name")
+        for name, time_us, used, free in samples:
+            print("{:10d} {:10d} {:10d}  {}".format(time_us, used, free, name))
+            total = totals.get(name)
+            if total is None:
+                totals[name] = [1, time_us, time_us, used]
+            else:
+                total[0] += 1
+                total[1] += time_us
+                total[2] = max(total[2], time_us)
+                total[3] = max(total[3], used)
+        print()
+        print("Calls   Total us     Max us   Max used  Name")
+        for name in sorted(totals):
+            calls, total_us, max_us, max_used = totals[name]
+            print(
+                "{:5d} {:10d} {:10d} {:10d}  {}".format(
+                    calls, total_us, max_us, max_used, name
+                )
+            )
+    if clear is True:
+        samples.clear()
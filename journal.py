@@ -0,0 +1,116 @@
+class Journal:
+    """
+    Undo and redo history for a TextBuffer. Each change is a small record
+    of (op, start line, line count, lines), where lines holds only text
+    that was removed or overwritten, so inserted lines cost nothing to
+    remember. Records made between checkpoints form one step that is
+    undone as a unit, and lines overwritten again and again within a
+    step are only remembered once. When history grows past max_bytes, the oldest steps
+    are forgotten.
+    """
+
+    INSERT = 0  # count lines were added at start
+    DELETE = 1  # lines were removed from start
+    REPLACE = 2  # lines at start were overwritten, lines holds the old text
+
+    record_size = 16  # rough bytes of RAM per record, not counting text
+
+    def __init__(self, max_bytes=4096):
+        self.max_bytes = max_bytes
+        self.clear()
+
+    def clear(self):
+        self._undo = []
+        self._redo = []
+        self._size = 0
+        self._open = False  # True while records join the newest step
+        self._dropped = False  # True when the open step was too big to keep
+
+    def _cost(self, step):
+        size = 0
+        for record in step:
+            size += self.record_size
+            if record[3] is not None:
+                for line in record[3]:
+                    size += len(line)
+        return size
+
+    def drop(self):
+        """
+        Forget all history because a change was too big to remember.
+        The rest of the current step is ignored too.
+        """
+        self.clear()
+        self._dropped = True
+
+    def checkpoint(self):
+        """
+        End the current step, so the next change starts a new one.
+        """
+        self._open = False
+        self._dropped = False
+
+    def record(self, op, start, count, lines=None):
+        """
+        Remember a change. Any changes that were undone can no longer be
+        redone after this.
+        """
+        if self._redo:
+            for step in self._redo:
+                self._size -= self._cost(step)
+            self._redo = []
+        if self._dropped is True:
+            return
+        if self._open is True and op == Journal.REPLACE:
+            last = self._undo[-1][-1]
+            if last[0] == Journal.REPLACE and last[1] == start and last[2] == count:
+                # Typing keeps overwriting the same line. Undoing the step
+                # only needs the text from before the first change.
+                return
+        if self._open is False:
+            self._undo.append([])
+            self._open = True
+        record = (op, start, count, lines)
+        self._undo[-1].append(record)
+        self._size += self._cost((record,))
+        while self._size > self.max_bytes and self._undo:
+            self._size -= self._cost(self._undo.pop(0))
+        if not self._undo:  # Even the newest step didn't fit.
+            self._open = False
+            self._dropped = True
+
+    def can_undo(self):
+        return len(self._undo) > 0
+
+    def can_redo(self):
+        return len(self._redo) > 0
+
+    def _replay(self, steps, other, apply):
+        """
+        Take the newest step from one history, reverse it with apply, and
+        put the reversing records on the other history.
+        """
+        if not steps:
+            return None
+        step = steps.pop()
+        reverse_step = []
+        for record in reversed(step):
+            reverse_step.append(apply(record))
+        other.append(reverse_step)
+        self._size += self._cost(reverse_step) - self._cost(step)
+        self._open = False
+        return reverse_step
+
+    def undo(self, apply):
+        """
+        Reverse the newest step. apply takes a record, reverses that change
+        in the buffer and returns a record of what it did. Returns the
+        records applied, or None when there is nothing to undo.
+        """
+        return self._replay(self._undo, self._redo, apply)
+
+    def redo(self, apply):
+        """
+        Put back the most recently undone step.
+        """
+        return self._replay(self._redo, self._undo, apply)
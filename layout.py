@@ -0,0 +1,73 @@
+class Layout:
+    """
+    Work out where lines too wide for the screen are broken into rows.
+    Wrapped lines break after a space when there is one in the second
+    half of the row, otherwise right at the edge (like minified JSON).
+    Truncated lines just stop at the edge.
+
+    Breaks are worked out once for each line of text and remembered, so
+    redrawing doesn't rescan long lines. The text itself is the key, so
+    an edited line, being new text, gets worked out again. Only the most
+    recent max_lines long lines are remembered. Lines that fit are never
+    stored.
+    """
+
+    max_lines = 64
+
+    def __init__(self, width, wrap=True):
+        self.wrap = wrap
+        self.set_width(width)
+
+    def set_width(self, width):
+        """
+        Change the row width, forgetting breaks worked out for the old one.
+        """
+        self.width = max(width, 1)
+        self._segments = {}
+        self._order = []
+
+    def _break(self, text):
+        width = self.width
+        segments = []
+        start = 0
+        while len(text) - start > width:
+            stop = start + width
+            space = text.rfind(" ", start + width // 2, stop)
+            if space != -1:
+                stop = space + 1
+            segments.append((start, stop))
+            start = stop
+        segments.append((start, len(text)))
+        return tuple(segments)
+
+    def segments(self, text):
+        """
+        Return (start, stop) character offsets of each row text is shown on.
+        """
+        if len(text) <= self.width:
+            return ((0, len(text)),)
+        if self.wrap is False:
+            return ((0, self.width),)
+        segments = self._segments.get(text)
+        if segments is None:
+            segments = self._break(text)
+            self._segments[text] = segments
+            self._order.append(text)
+            if len(self._order) > self.max_lines:
+                del self._segments[self._order.pop(0)]
+        return segments
+
+    def rows(self, text):
+        return len(self.segments(text))
+
+    def locate(self, text, col):
+        """
+        Return the (row within the line, column within the row) where
+        column col (from 1) of text is shown.
+        """
+        segments = self.segments(text)
+        row = 0
+        for start, stop in segments:
+            if col - 1 < stop or row == len(segments) - 1:
+                return row, min(col - start, self.width)
+            row += 1
@@ -0,0 +1,96 @@
+import os
+from array import array
+
+
+def _file_stamp(filename):
+    properties = os.stat(filename)
+    return properties[6], properties[8]  # size, mtime
+
+
+class LineIndex:
+    """
+    Byte offsets where each line of a file starts, plus a final entry for
+    the end of the file. Four bytes per line lets any line be read with a
+    single seek. The index can be cached next to the file and is reused
+    as long as the file size and modification time still match.
+    """
+
+    block_size = 512  # bytes read at a time while scanning
+    suffix = ".idx"  # appended to the file name for the cache file
+    magic = b"LIDX"
+
+    def __init__(self, offsets=None):
+        self.offsets = array("I", [0]) if offsets is None else offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def span(self, start, stop):
+        """
+        Return the (first byte, end byte) of lines start..stop-1.
+        """
+        return self.offsets[start], self.offsets[stop]
+
+    def append(self, position):
+        """
+        Record the end of another line, given as a file position.
+        """
+        self.offsets.append(position)
+
+    def scan(self, file):
+        """
+        Add entries for every line from the current end of the index to
+        the end of the file.
+        """
+        position = self.offsets[-1]
+        file.seek(position)
+        while True:
+            block = file.read(self.block_size)
+            if not block:
+                break
+            found = block.find(b"\n")
+            while found != -1:
+                self.offsets.append(position + found + 1)
+                found = block.find(b"\n", found + 1)
+            position += len(block)
+        if self.offsets[-1] != position:  # last line has no end of line
+            self.offsets.append(position)
+
+    def save(self, filename):
+        """
+        Cache the index of filename next to it.
+        """
+        size, mtime = _file_stamp(filename)
+        with open(filename + self.suffix, "wb") as f:
+            f.write(self.magic)
+            f.write(array("I", [size, mtime, len(self.offsets)]))
+            f.write(self.offsets)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Return the cached index of filename, or None when there is no
+        cache or the file has changed since it was made.
+        """
+        try:
+            with open(filename + cls.suffix, "rb") as f:
+                if f.read(len(cls.magic)) != cls.magic:
+                    return None
+                size, mtime, count = array("I", f.read(12))
+                if (size, mtime) != _file_stamp(filename):
+                    return None
+                offsets = array("I", f.read(4 * count))
+        except (OSError, ValueError):
+            return None
+        if len(offsets) != count:
+            return None
+        return cls(offsets)
+
+    @classmethod
+    def build(cls, file):
+        """
+        Scan an open binary file from the start.
+        """
+        index = cls()
+        index.scan(file)
+        return index
@@ -0,0 +1,104 @@
+from array import array
+from journal import Journal
+
+
+class MarkList:
+    """
+    Line numbers, in ascending order, that follow their lines as lines
+    are inserted and deleted. Handed out one at a time by iterating.
+    Marks on deleted lines are skipped. Used by the g and v commands to
+    remember every matching line before changing any of them.
+
+    Most changes happen at or after the mark being worked on, which
+    moves every mark still to come by the same amount. That is kept as
+    a single shift instead of updating each mark.
+    """
+
+    def __init__(self, lines=None):
+        self._lines = array("I") if lines is None else lines
+        self._next = 0
+        self._shift = 0
+
+    def __len__(self):
+        return len(self._lines)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        lines = self._lines
+        while self._next < len(lines):
+            line = lines[self._next]
+            self._next += 1
+            if line != 0:  # 0 marks a deleted line
+                return line + self._shift
+        raise StopIteration
+
+    def append(self, line_num):
+        self._lines.append(line_num)
+
+    def shift(self, op, start, count):
+        """
+        Move marks still to come to account for a change, given the same
+        way as a journal record.
+        """
+        lines = self._lines
+        while self._next < len(lines) and lines[self._next] == 0:
+            self._next += 1
+        if self._next >= len(lines) or op == Journal.REPLACE:
+            return
+        end = start + count if op == Journal.DELETE else start
+        if end <= lines[self._next] + self._shift:  # All marks are past it.
+            self._shift += count if op == Journal.INSERT else -count
+            return
+        for i in range(self._next, len(lines)):
+            line = lines[i]
+            if line == 0:
+                continue
+            line += self._shift
+            if op == Journal.INSERT:
+                if line >= start:
+                    line += count
+            elif line >= end:
+                line -= count
+            elif line >= start:
+                line = 0
+            lines[i] = line
+        self._shift = 0
+
+
+class NamedMarks:
+    """
+    Lines marked by name with the k command, so 'x can be used as an
+    address. Marks follow their lines as lines are inserted and deleted,
+    and a mark on a deleted line is forgotten.
+    """
+
+    def __init__(self):
+        self._lines = {}
+
+    def get(self, name):
+        return self._lines.get(name)
+
+    def set(self, name, line_num):
+        self._lines[name] = line_num
+
+    def clear(self):
+        self._lines.clear()
+
+    def shift(self, op, start, count):
+        """
+        Move marks to account for a change, given the same way as a
+        journal record.
+        """
+        if op == Journal.REPLACE:
+            return
+        for name in list(self._lines):
+            line = self._lines[name]
+            if op == Journal.INSERT:
+                if line >= start:
+                    self._lines[name] = line + count
+            elif line >= start + count:
+                self._lines[name] = line - count
+            elif line >= start:
+                del self._lines[name]
@@ -0,0 +1,95 @@
+from line_index import LineIndex
+
+
+class PagedFile:
+    """
+    Read-only lines of a file, read from flash only when needed. Just an
+    index of line start offsets is kept in RAM, along with a few recently
+    used pages of decoded lines. Meant to be used as a PieceTable source.
+    """
+
+    page_lines = 32  # lines decoded together on a page miss
+    max_pages = 4  # pages kept in the least recently used cache
+
+    def __init__(self, filename, index=None, cache_index=False):
+        self.filename = filename
+        self._file = open(filename, "rb")
+        if index is None and cache_index is True:
+            index = LineIndex.load(filename)
+        if index is None:
+            index = LineIndex.build(self._file)
+            if cache_index is True:
+                index.save(filename)
+        self.index = index
+        self._pages = {}
+        self._lru = []
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, index):
+        page_num = index // self.page_lines
+        return self._get_page(page_num)[index - page_num * self.page_lines]
+
+    def _get_page(self, page_num):
+        """
+        Return a list of decoded lines for the page, reading it if needed.
+        """
+        if page_num in self._pages:
+            self._lru.remove(page_num)
+            self._lru.append(page_num)
+            return self._pages[page_num]
+
+        first = page_num * self.page_lines
+        last = min(first + self.page_lines, len(self))
+        lines = self.read_range(first, last)
+
+        self._pages[page_num] = lines
+        self._lru.append(page_num)
+        if len(self._lru) > self.max_pages:
+            del self._pages[self._lru.pop(0)]
+        return lines
+
+    def read_range(self, first, last):
+        """
+        Read lines first..last-1 with a single seek and read.
+        """
+        offsets = self.index.offsets
+        base, end = self.index.span(first, last)
+        self._file.seek(base)
+        data = self._file.read(end - base)
+        lines = []
+        for i in range(first, last):
+            start = offsets[i] - base
+            stop = offsets[i + 1] - base
+            lines.append(data[start:stop].decode().rstrip("\r\n"))
+        return lines
+
+    def lines(self, first, last):
+        """
+        Yield lines first..last-1 a page at a time.
+        """
+        while first < last:
+            page_num = first // self.page_lines
+            page = self._get_page(page_num)
+            page_first = page_num * self.page_lines
+            stop = min(last, page_first + len(page))
+            for i in range(first - page_first, stop - page_first):
+                yield page[i]
+            first = stop
+
+    def ends_with(self, text):
+        """
+        Check if the file ends with text, such as an end of line marker.
+        """
+        data = text.encode()
+        end = self.index.offsets[-1]
+        if end < len(data):
+            return end == 0
+        self._file.seek(end - len(data))
+        return self._file.read(len(data)) == data
+
+    def close(self):
+        self._pages = {}
+        self._lru = []
+        self._file.close()
@@ -0,0 +1,277 @@
+from array import array
+
+
+class TextSource:
+    """
+    Read-only lines held in a single string and located by an array of
+    line start offsets. One string plus four bytes per line is far more
+    compact than a separate string object for every line.
+    """
+
+    def __init__(self, text=""):
+        self._text = text
+        self._offsets = array("I", [0])
+        pos = text.find("\n")
+        while pos != -1:
+            self._offsets.append(pos + 1)
+            pos = text.find("\n", pos + 1)
+        if self._offsets[-1] != len(text):  # last line has no end of line
+            self._offsets.append(len(text))
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        start = self._offsets[index]
+        stop = self._offsets[index + 1]
+        return self._text[start:stop].rstrip("\r\n")
+
+
+class PieceTable:
+    """
+    List-like line storage made of pieces, where each piece is a run of
+    consecutive lines in one of the read-only sources. Source 0 is an
+    append-only list of added lines. Other sources are typically whole
+    files. Edits only split and rearrange pieces, so the cost depends on
+    the number of pieces rather than the number of lines. Line lookup is
+    a binary search over the piece boundaries, but an edit is still
+    O(pieces), since the end positions of the pieces after it are worked
+    out again. A balanced tree would make edits O(log pieces) too, at
+    several times the RAM per piece, and a file only gains a piece or two
+    per edit, so a flat list is the better trade here.
+    """
+
+    def __init__(self, lines=None):
+        self._added = []
+        self._sources = [self._added]
+        self._pieces = []  # (source id, first line in source, line count)
+        self._ends = []  # line index just past the end of each piece
+        if lines is not None:
+            self.extend(lines)
+
+    def __len__(self):
+        return self._ends[-1] if self._ends else 0
+
+    def __iter__(self):
+        return self.lines(0, len(self))
+
+    def __eq__(self, other):
+        if len(self) != len(other):
+            return False
+        for mine, theirs in zip(self, other):
+            if mine != theirs:
+                return False
+        return True
+
+    def __repr__(self):
+        return "PieceTable({:d} lines, {:d} pieces)".format(
+            len(self), len(self._pieces)
+        )
+
+    def _slice_range(self, index):
+        """
+        Turn a slice into (start, stop) line indexes, list style.
+        """
+        if index.step is not None and index.step != 1:
+            raise ValueError("extended slices not supported")
+        length = len(self)
+        start = 0 if index.start is None else index.start
+        stop = length if index.stop is None else index.stop
+        if start < 0:
+            start = max(start + length, 0)
+        if stop < 0:
+            stop = max(stop + length, 0)
+        start = min(start, length)
+        stop = min(stop, length)
+        return start, max(start, stop)
+
+    def _normalize(self, index):
+        length = len(self)
+        if index < 0:
+            index += length
+        if index < 0 or index >= length:
+            raise IndexError("line index out of range")
+        return index
+
+    def _locate(self, index):
+        """
+        Binary search for the piece holding line index.
+        """
+        low = 0
+        high = len(self._ends)
+        while low < high:
+            mid = (low + high) // 2
+            if self._ends[mid] > index:
+                high = mid
+            else:
+                low = mid + 1
+        return low
+
+    def _reindex(self, piece_num):
+        """
+        Recalculate piece end positions starting from piece_num.
+        """
+        del self._ends[piece_num:]
+        end = self._ends[-1] if self._ends else 0
+        for src_id, first, count in self._pieces[piece_num:]:
+            end += count
+            self._ends.append(end)
+
+    def _split(self, index):
+        """
+        Make sure a piece begins at line index and return its position.
+        """
+        if index >= len(self):
+            return len(self._pieces)
+        piece_num = self._locate(index)
+        piece_start = self._ends[piece_num] - self._pieces[piece_num][2]
+        if piece_start == index:
+            return piece_num
+        src_id, first, count = self._pieces[piece_num]
+        head_count = index - piece_start
+        self._pieces[piece_num] = (src_id, first, head_count)
+        self._pieces.insert(
+            piece_num + 1, (src_id, first + head_count, count - head_count)
+        )
+        self._ends.insert(piece_num, index)
+        return piece_num + 1
+
+    def _insert_pieces(self, index, pieces):
+        piece_num = self._split(index)
+        self._pieces[piece_num:piece_num] = pieces
+        self._reindex(piece_num)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop = self._slice_range(index)
+            return list(self.lines(start, stop))
+        index = self._normalize(index)
+        piece_num = self._locate(index)
+        src_id, first, count = self._pieces[piece_num]
+        offset = index - (self._ends[piece_num] - count)
+        return self._sources[src_id][first + offset]
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            start, stop = self._slice_range(index)
+            del self[start:stop]
+            for line in value:
+                self.insert(start, line)
+                start += 1
+        else:
+            index = self._normalize(index)
+            del self[index]
+            self.insert(index, value)
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            start, stop = self._slice_range(index)
+        else:
+            start = self._normalize(index)
+            stop = start + 1
+        if start == stop:
+            return
+        first_piece = self._split(start)
+        last_piece = self._split(stop)
+        del self._pieces[first_piece:last_piece]
+        self._reindex(first_piece)
+
+    def lines(self, start, stop):
+        """
+        Yield lines start..stop-1 piece by piece, letting sources that
+        can read a range of lines (like PagedFile) do so.
+        """
+        if start >= stop:
+            return
+        piece_num = self._locate(start)
+        while start < stop:
+            src_id, first, count = self._pieces[piece_num]
+            source = self._sources[src_id]
+            piece_start = self._ends[piece_num] - count
+            piece_stop = min(stop, self._ends[piece_num])
+            src_start = first + start - piece_start
+            src_stop = first + piece_stop - piece_start
+            if hasattr(source, "lines"):
+                yield from source.lines(src_start, src_stop)
+            else:
+                for i in range(src_start, src_stop):
+                    yield source[i]
+            start = piece_stop
+            piece_num += 1
+
+    def insert(self, index, line):
+        """
+        Add a line before index, the same way list.insert does.
+        """
+        length = len(self)
+        if index < 0:
+            index = max(index + length, 0)
+        index = min(index, length)
+        self._added.append(line)
+        added_index = len(self._added) - 1
+        piece_num = self._split(index)
+        if piece_num > 0:  # Typing consecutive lines extends the same piece.
+            src_id, first, count = self._pieces[piece_num - 1]
+            if src_id == 0 and first + count == added_index:
+                self._pieces[piece_num - 1] = (0, first, count + 1)
+                self._reindex(piece_num - 1)
+                return
+        self._insert_pieces(index, [(0, added_index, 1)])
+
+    def append(self, line):
+        self.insert(len(self), line)
+
+    def extend(self, lines):
+        for line in lines:
+            self.append(line)
+
+    def add_source(self, source, index=None):
+        """
+        Place all lines of a read-only source (like TextSource) before
+        index, or at the end when index is None.
+        """
+        self._sources.append(source)
+        if len(source) > 0:
+            if index is None:
+                index = len(self)
+            self._insert_pieces(index, [(len(self._sources) - 1, 0, len(source))])
+
+    def copy_lines(self, start, stop, dest):
+        """
+        Copy lines start..stop-1 to just before dest by duplicating piece
+        references instead of line text.
+        """
+        first_piece = self._split(start)
+        last_piece = self._split(stop)
+        pieces = self._pieces[first_piece:last_piece]
+        self._insert_pieces(dest, pieces)
+
+    def prefix_source(self):
+        """
+        Return the source whose lines, all of them and in order, start the
+        table. Return None if the first piece is anything else.
+        """
+        if len(self._pieces) == 0:
+            return None
+        src_id, first, count = self._pieces[0]
+        source = self._sources[src_id]
+        if src_id == 0 or first != 0 or count != len(source):
+            return None
+        return source
+
+    def uses_file(self, filename):
+        """
+        Check if any source reads its lines from filename on demand.
+        """
+        for source in self._sources:
+            if getattr(source, "filename", None) == filename:
+                return True
+        return False
+
+    def close(self):
+        """
+        Close any sources that hold open files.
+        """
+        for source in self._sources:
+            if hasattr(source, "close"):
+                source.close()
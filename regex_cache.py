@@ -0,0 +1,28 @@
+from re import compile
+
+# Most recently used compiled patterns, so repeated searches skip compiling.
+max_patterns = 8
+_patterns = {}
+_lru = []
+
+
+def get_regex(expr):
+    """
+    Return a compiled regular expression for expr, reusing a cached one
+    when the same expression was used recently. Already compiled
+    expressions are passed through unchanged.
+    """
+    if not isinstance(expr, str):
+        return expr
+    regex = _patterns.get(expr)
+    if regex is not None:
+        if _lru[-1] != expr:
+            _lru.remove(expr)
+            _lru.append(expr)
+        return regex
+    regex = compile(expr)
+    _patterns[expr] = regex
+    _lru.append(expr)
+    if len(_lru) > max_patterns:
+        del _patterns[_lru.pop(0)]
+    return regex
@@ -0,0 +1,74 @@
+import unittest
+from atto import Atto
+from journal import Journal
+from marks import MarkList
+
+class TestAttoGlobal(unittest.TestCase):
+    def __init__(self):
+        self.e = Atto()
+        self.e.verbose = False
+
+    def load(self):
+        self.e._buffer = ['alpha', 'beta', 'gamma', 'delta', 'beta', 'epsilon']
+        self.e.journal.clear()
+        self.e._current_line = 1
+
+    def test_substitute(self):
+        self.load()
+        self.e.run_command('%s/a/A/')
+        self.assertEqual(self.e._buffer, ['Alpha', 'betA', 'gAmma', 'deltA', 'betA', 'epsilon'])
+        self.e.run_command('3s/a/[&]/g')
+        self.assertEqual(self.e._buffer[2], 'gAmm[a]')
+        self.assertEqual(self.e._current_line, 3)
+
+    def test_global_delete(self):
+        self.load()
+        self.e.run_command('g/beta/d')
+        self.assertEqual(self.e._buffer, ['alpha', 'gamma', 'delta', 'epsilon'])
+
+    def test_global_offset(self):
+        self.load()
+        self.e.run_command('g/alpha/-1d')
+        self.assertEqual(len(self.e._buffer), 6)
+        self.e.run_command('g/beta/-1d')
+        self.assertEqual(self.e._buffer, ['beta', 'gamma', 'beta', 'epsilon'])
+        self.assertEqual(self.e.run_script(['0a', 'zero', '.'], write=False), [])
+        self.assertEqual(self.e._buffer[0], 'zero')
+
+    def test_global_inverse(self):
+        self.load()
+        self.e.run_command('v/^[ab]/s/$/!/')
+        self.assertEqual(self.e._buffer, ['alpha', 'beta', 'gamma!', 'delta!', 'beta', 'epsilon!'])
+
+    def test_global_marks_follow_lines(self):
+        self.load()
+        self.e.run_command('g/beta/m0')
+        self.assertEqual(self.e._buffer, ['beta', 'beta', 'alpha', 'gamma', 'delta', 'epsilon'])
+
+    def test_global_undo(self):
+        self.load()
+        self.e.checkpoint()
+        self.e.run_command('g/a$/.,$d')
+        self.assertEqual(self.e._buffer, [])
+        self.e.undo()
+        self.assertEqual(self.e._buffer, ['alpha', 'beta', 'gamma', 'delta', 'beta', 'epsilon'])
+
+    def test_sort(self):
+        self.load()
+        self.e.checkpoint()
+        self.e.run_command('2,5S u')
+        self.assertEqual(self.e._buffer, ['alpha', 'beta', 'delta', 'gamma', 'epsilon'])
+        self.e.undo()
+        self.assertEqual(self.e._buffer, ['alpha', 'beta', 'gamma', 'delta', 'beta', 'epsilon'])
+
+    def test_mark_list(self):
+        marks = MarkList()
+        for line_num in (2, 5, 9):
+            marks.append(line_num)
+        self.assertEqual(next(marks), 2)
+        marks.shift(Journal.INSERT, 1, 3)
+        marks.shift(Journal.DELETE, 8, 1)
+        self.assertEqual(list(marks), [11])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -92,5 +92,80 @@ class TestAttoParser(unittest.TestCase):
         cmd_string = '{:d},{:d}m%'.format(addr1, addr2)  # % as destination is invalid
         self.assertEqual(self.e.parse(cmd_string), (addr1, addr2, 'm', '%'))
 
+class TestAttoAddress(unittest.TestCase):
+    def __init__(self):
+        self.e = Atto()
+        self.e.verbose = False
+        self.e._buffer = [
+            'How are you gentlemen?',
+            'All your base are belong to us!',
+            'You are on the way to destruction.',
+            'You have no chance to survive. Make your time.'
+        ]
+
+    def test_offsets(self):
+        self.e._current_line = 2
+        self.assertEqual(self.e.parse('+'), (3, None, 'p', ''))
+        self.assertEqual(self.e.parse('-,+2n'), (1, 4, 'n', ''))
+        self.assertEqual(self.e.parse('$-1d'), (3, None, 'd', ''))
+        self.assertEqual(self.e.parse('/destruction/+1'), (4, None, 'p', ''))
+
+    def test_below_first_line(self):
+        self.e._current_line = 1
+        self.assertEqual(self.e.parse('-')[0], 0)
+        self.assertEqual(self.e.parse('-2p')[0], -1)
+        for cmd_string in ('-d', '.-1d', '0d', '-p', '-2,.d'):
+            self.assertFalse(self.e.run_command(cmd_string))
+        self.e._current_line = 2
+        self.assertFalse(self.e.run_command('-2,.d'))
+        self.assertEqual(len(self.e._buffer), 4)
+        self.assertEqual(self.e._current_line, 2)
+
+    def test_backward_regex(self):
+        self.e._current_line = 3
+        self.assertEqual(self.e.parse('?are?p')[0], 2)
+        self.assertEqual(self.e.parse('?base')[0], 2)
+        self.assertEqual(self.e.parse('?destruction?')[0], 3)
+        self.assertEqual(self.e.parse('?time?')[0], 4)
+        self.assertEqual(self.e.parse('?nowhere?')[0], -1)
+
+    def test_repeated_search(self):
+        self.e._current_line = 1
+        found = []
+        for _ in range(4):
+            self.e._current_line = self.e.parse('/You/')[0]
+            found.append(self.e._current_line)
+        self.assertEqual(found, [3, 4, 3, 4])
+        found = []
+        for _ in range(3):
+            self.e._current_line = self.e.parse('?are?')[0]
+            found.append(self.e._current_line)
+        self.assertEqual(found, [3, 2, 1])
+
+    def test_semicolon(self):
+        self.e._current_line = 4
+        self.assertEqual(self.e.parse('1;/are/'), (1, 2, 'p', ''))
+        self.assertEqual(self.e.parse('2;+1p'), (2, 3, 'p', ''))
+        self.assertEqual(self.e._current_line, 2)
+        self.assertEqual(self.e.parse(';')[:2], (2, 4))
+        self.assertEqual(self.e.parse(',')[:2], (1, 4))
+
+    def test_mark(self):
+        self.e._current_line = 4
+        self.e.run_command('2ka')
+        self.assertEqual(self.e.parse("'a")[0], 2)
+        self.e.run_command('1d')
+        self.assertEqual(self.e.parse("'a,$p")[:2], (1, 3))
+        self.assertEqual(self.e.parse("'b")[0], -1)
+        self.assertEqual(self.e.parse("'")[0], -1)
+        self.e.undo()
+
+    def test_compiled(self):
+        command = self.e.compile('.,+1p')
+        self.e._current_line = 1
+        self.assertEqual(self.e.resolve(command), (1, 2, 'p', ''))
+        self.e._current_line = 3
+        self.assertEqual(self.e.resolve(command), (3, 4, 'p', ''))
+
 if __name__ == '__main__':
     unittest.main()
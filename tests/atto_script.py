@@ -0,0 +1,78 @@
+import unittest
+import os
+import sys
+import text_buffer
+from atto import Atto, atto
+
+tests_dir = __file__.rsplit('/', 1)[0] if '/' in __file__ else '.'
+
+class Recorder:
+    def __init__(self):
+        self.text = ''
+
+    def write(self, text):
+        self.text += text
+
+class TestAttoScript(unittest.TestCase):
+    def __init__(self):
+        self.e = Atto()
+        self.e.verbose = False
+        self.temp = tests_dir + '/atto_script_temp.txt'
+
+    def tearDown(self):
+        if 'atto_script_temp.txt' in os.listdir(tests_dir):
+            os.remove(self.temp)
+
+    def load(self):
+        self.e._buffer = ['DEBUG = True', 'SSID = "home"', 'PASS = "oops"']
+        self.e.journal.clear()
+        self.e._is_dirty = False
+
+    def test_script(self):
+        self.load()
+        failed = self.e.run_script(['%s/True/False/', '/PASS/c', 'PASS = "secret"', '.', '$a', 'PORT = 80', '.'], write=False)
+        self.assertEqual(failed, [])
+        self.assertEqual(self.e._buffer, ['DEBUG = False', 'SSID = "home"', 'PASS = "secret"', 'PORT = 80'])
+        self.e.run_command('u')
+        self.assertEqual(self.e._buffer, ['DEBUG = False', 'SSID = "home"', 'PASS = "secret"'])
+
+    def test_failed(self):
+        self.load()
+        failed = self.e.run_script(['9d', 'p', 'x', 'q', '1d'], write=False)
+        self.assertEqual(failed, [(1, '9d'), (3, 'x')])
+        self.assertEqual(len(self.e._buffer), 3)
+
+    def test_write(self):
+        self.load()
+        self.e.filename = self.temp
+        self.e.run_script(['1d'])
+        self.assertFalse(self.e._is_dirty)
+        saved = Atto(self.temp)
+        self.assertEqual(saved._buffer, ['SSID = "home"', 'PASS = "oops"'])
+
+    def test_quit_without_saving(self):
+        with open(self.temp, 'w') as f:
+            f.write('DEBUG = True\nPORT = 80\n')
+        self.assertEqual(atto(self.temp, script=['1d', 'q!', '1d']), [])
+        with open(self.temp) as f:
+            self.assertEqual(f.read(), 'DEBUG = True\nPORT = 80\n')
+        self.assertEqual(atto(self.temp, script=['1d', '1q', '1d']), [])
+        with open(self.temp) as f:
+            self.assertEqual(f.read(), 'PORT = 80\n')
+
+    def test_quiet_load(self):
+        with open(self.temp, 'w') as f:
+            f.write('DEBUG = True\nPORT = 80\n')
+        recorder = Recorder()
+        text_buffer.stdout = recorder
+        try:
+            failed = atto(self.temp, script=['1d'])
+        finally:
+            text_buffer.stdout = sys.stdout
+        self.assertEqual(failed, [])
+        self.assertEqual(recorder.text, '')
+        with open(self.temp) as f:
+            self.assertEqual(f.read(), 'PORT = 80\n')
+
+if __name__ == '__main__':
+    unittest.main()
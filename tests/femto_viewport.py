@@ -0,0 +1,31 @@
+import unittest
+from femto import Viewport
+
+class TestViewport(unittest.TestCase):
+    def __init__(self):
+        self.v = Viewport(2, 23, 80)
+
+    def test_row(self):
+        self.v.top_line = 10
+        self.assertEqual(self.v.row(10), 2)
+        self.assertEqual(self.v.row(31), 23)
+        self.assertEqual(self.v.row(32), None)
+        self.assertEqual(self.v.row(9), None)
+
+    def test_follow_down(self):
+        self.v.top_line = 1
+        self.v.line = 23
+        self.assertEqual(self.v.follow(), (1, False))
+        self.assertEqual(self.v.cursor(), (23, 1))
+
+    def test_follow_sideways(self):
+        self.v.top_line = self.v.line = 1
+        self.v.col = 100
+        self.assertEqual(self.v.follow(), (0, True))
+        self.assertEqual(self.v.cursor(), (2, 40))
+        self.v.col = 1
+        self.v.follow()
+        self.assertEqual(self.v.left, 0)
+
+if __name__ == '__main__':
+    unittest.main()
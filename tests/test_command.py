@@ -0,0 +1,158 @@
+import unittest
+import os
+from command import cat, cp, du, find, grep, ls, pipe, rm, sort, to, uniq
+from external_sort import sort_lines
+
+tests_dir = __file__.rsplit('/', 1)[0] if '/' in __file__ else '.'
+
+class TestGrep(unittest.TestCase):
+    def __init__(self):
+        with open(tests_dir + '/lipsum.txt') as f:
+            self.lines = [line.rstrip('\r\n') for line in f]
+
+    def test_matches(self):
+        found = list(grep('Aut', tests_dir + '/lipsum.txt', pipe=True))
+        self.assertEqual(found, [line for line in self.lines if 'Aut' in line])
+
+    def test_line_numbers(self):
+        found = list(grep('Hic', tests_dir + '/lipsum.txt', line_numbers=True, pipe=True))
+        self.assertEqual(found[0].split(':')[0], str(self.lines.index(found[0].split(':', 1)[1]) + 1))
+
+    def test_count(self):
+        found = list(grep('et', tests_dir + '/lipsum.txt', count=True, pipe=True))
+        self.assertEqual(found, [str(len([line for line in self.lines if 'et' in line]))])
+
+    def test_max_count(self):
+        found = list(grep('et', tests_dir + '/lipsum.txt', max_count=2, pipe=True))
+        self.assertEqual(len(found), 2)
+
+    def test_filename_keyword(self):
+        found = list(grep('Aut', filename=tests_dir + '/lipsum.txt', pipe=True))
+        self.assertEqual(found, [line for line in self.lines if 'Aut' in line])
+        self.assertEqual(grep('Aut'), None)
+
+    def test_multiple_files(self):
+        found = list(grep('Hic', tests_dir + '/lipsum.txt', tests_dir + '/*.txt', pipe=True))
+        self.assertEqual(found[0], tests_dir + '/lipsum.txt:' + found[0].split(':', 1)[1])
+        self.assertEqual(len(found), 2)
+
+class TestPipe(unittest.TestCase):
+    def __init__(self):
+        with open(tests_dir + '/lipsum.txt') as f:
+            self.lines = [line.rstrip('\r\n') for line in f]
+
+    def tearDown(self):
+        try:
+            os.remove(tests_dir + '/pipe_temp.txt')
+        except OSError:
+            pass
+
+    def test_cat_lines(self):
+        self.assertEqual(list(cat(tests_dir + '/lipsum.txt', pipe=True)), self.lines)
+        self.assertEqual(list(cat(tests_dir + '/lipsum.txt', head=2, pipe=True)), self.lines[:2])
+        self.assertEqual(list(cat(tests_dir + '/lipsum.txt', tail=2, pipe=True)), self.lines[-2:])
+
+    def test_filter(self):
+        found = list(grep('Aut', pipe=True)(iter(self.lines)))
+        self.assertEqual(found, [line for line in self.lines if 'Aut' in line])
+
+    def test_to(self):
+        pipe(cat(tests_dir + '/lipsum.txt', pipe=True), grep('et', pipe=True), to(tests_dir + '/pipe_temp.txt'))
+        with open(tests_dir + '/pipe_temp.txt') as f:
+            written = [line.rstrip('\n') for line in f]
+        self.assertEqual(written, [line for line in self.lines if 'et' in line])
+
+class TestSort(unittest.TestCase):
+    def __init__(self):
+        with open(tests_dir + '/lipsum.txt') as f:
+            self.lines = [line.rstrip('\r\n') for line in f]
+
+    def test_in_memory(self):
+        self.assertEqual(list(sort(tests_dir + '/lipsum.txt', pipe=True)), sorted(self.lines))
+        self.assertEqual(list(sort(reverse=True, pipe=True)(iter(self.lines))), sorted(self.lines, reverse=True))
+
+    def test_runs(self):
+        words = ' '.join(self.lines).split()
+        with open(tests_dir + '/sort0.tmp', 'w') as f:
+            f.write('keep me\n')
+        try:
+            before = sorted(os.listdir(tests_dir))
+            self.assertEqual(list(sort_lines(iter(words), max_bytes=200, temp_dir=tests_dir)), sorted(words))
+            first = sort_lines(iter(words), unique=True, max_bytes=200, temp_dir=tests_dir)
+            second = sort_lines(iter(words), reverse=True, max_bytes=200, temp_dir=tests_dir)
+            head = [next(first), next(second)]  # Both have their runs written now.
+            self.assertEqual([head[0]] + list(first), sorted(set(words)))
+            self.assertEqual([head[1]] + list(second), sorted(words, reverse=True))
+            self.assertEqual(sorted(os.listdir(tests_dir)), before)
+            with open(tests_dir + '/sort0.tmp') as f:
+                self.assertEqual(f.read(), 'keep me\n')
+        finally:
+            os.remove(tests_dir + '/sort0.tmp')
+
+    def test_uniq(self):
+        self.assertEqual(list(uniq(pipe=True)(iter(['a', 'a', 'b', 'a']))), ['a', 'b', 'a'])
+        self.assertEqual(list(uniq(count=True, pipe=True)(iter(['a', 'a', 'b']))), ['      2 a', '      1 b'])
+
+class TestTree(unittest.TestCase):
+    def __init__(self):
+        self.top = tests_dir + '/tree_temp'
+
+    def setUp(self):
+        os.mkdir(self.top)
+        os.mkdir(self.top + '/sub')
+        cp(tests_dir + '/lipsum.txt', self.top + '/sub')
+
+    def tearDown(self):
+        if 'tree_temp' in os.listdir(tests_dir):
+            rm(self.top, recursive=True)
+
+    def test_find(self):
+        self.assertEqual(list(find(self.top, pipe=True)), [self.top + '/sub', self.top + '/sub/lipsum.txt'])
+        self.assertEqual(list(find(self.top, type='d', pipe=True)), [self.top + '/sub'])
+        self.assertEqual(list(find(self.top, name='*.md', pipe=True)), [])
+
+    def test_cp(self):
+        cp(self.top + '/sub', self.top + '/copy', recursive=True)
+        self.assertEqual(list(cat(self.top + '/copy/lipsum.txt', pipe=True)), list(cat(tests_dir + '/lipsum.txt', pipe=True)))
+
+    def test_du(self):
+        import command
+        printed = []
+        command.print = printed.append
+        try:
+            du(self.top + '/', summarize=True)
+        finally:
+            del command.print
+        size = (os.stat(tests_dir + '/lipsum.txt')[6] + 1023) // 1024
+        self.assertEqual(printed, ['{:8d}K  {}'.format(size, self.top)])
+
+    def test_ls(self):
+        with open(self.top + '/big.txt', 'w') as f:
+            f.write('x' * 2000)
+        self.assertEqual(list(ls(self.top, long=False, sort='name', pipe=True)), ['big.txt', 'sub/'])
+        self.assertEqual(list(ls(self.top, long=False, recursive=True, sort='name', pipe=True)), ['big.txt', 'sub/', 'sub/lipsum.txt'])
+        self.assertEqual(list(ls(self.top, long=False, recursive=True, sort='size', reverse=True, pipe=True)), ['big.txt', 'sub/lipsum.txt', 'sub/'])
+        rows = list(ls(self.top, recursive=True, sort='name', pipe=True))
+        self.assertEqual([row.split()[:2] for row in rows], [['-', '2000'], ['d', '0'], ['-', '1174']])
+        self.assertTrue(rows[2].endswith('  sub/lipsum.txt'))
+
+    def test_ls_same_size_edit(self):
+        import command
+        filename = self.top + '/big.txt'
+        with open(filename, 'w') as f:
+            f.write('x' * 2000)
+        list(ls(self.top, pipe=True))
+        with open(filename, 'w') as f:
+            f.write('y' * 2000)
+        if hasattr(os, 'utime'):
+            os.utime(filename, (0, 86400 * 400))
+            self.assertEqual(list(ls(self.top, long=False, sort='time', pipe=True))[0], 'big.txt')
+        row = list(ls(self.top, sort='name', pipe=True))[0]
+        self.assertTrue(command._short_date(os.stat(filename)[8]) in row)
+
+    def test_rm(self):
+        rm(self.top, recursive=True)
+        self.assertFalse('tree_temp' in os.listdir(tests_dir))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+from highlight import Highlighter, lex, CODE, IN_DOUBLE, KEYWORD, STRING, COMMENT, NUMBER
+from text_buffer import TextBuffer
+
+class TestHighlight(unittest.TestCase):
+    def __init__(self):
+        self.buffer = TextBuffer()
+        self.buffer.verbose = False
+        self.highlighter = Highlighter(self.buffer)
+        self.buffer._mark_lists.append(self.highlighter)
+        for line in ('x = 1', 'y = 2', 'z = 3', 'w = 4'):
+            self.buffer.insert_line(len(self.buffer._buffer) + 1, line)
+
+    def test_lex(self):
+        spans = []
+        self.assertEqual(lex('if x == 42: s = "a#b"  # note', CODE, spans), CODE)
+        self.assertEqual(spans, [(0, 2, KEYWORD), (8, 10, NUMBER), (16, 21, STRING), (23, 29, COMMENT)])
+
+    def test_triple_quote(self):
+        spans = []
+        self.assertEqual(lex('s = """start', CODE, spans), IN_DOUBLE)
+        self.assertEqual(spans, [(4, 12, STRING)])
+        spans = []
+        self.assertEqual(lex('end""" if', IN_DOUBLE, spans), CODE)
+        self.assertEqual(spans, [(0, 6, STRING), (7, 9, KEYWORD)])
+
+    def test_edit(self):
+        self.assertEqual(self.highlighter.state(4), CODE)
+        self.buffer.update_line(2, 'y = """')
+        self.assertEqual(self.highlighter.state(4), IN_DOUBLE)
+        self.assertEqual(self.highlighter.spans(3, 'z = 3'), ((0, 5, STRING),))
+        self.buffer.insert_line(3, '"""')
+        self.assertEqual(self.highlighter.state(4), CODE)
+        self.buffer.delete_line(3)
+        self.assertEqual(self.highlighter.state(5), IN_DOUBLE)
+        self.buffer.undo()
+        self.assertEqual(self.highlighter.state(5), CODE)
+
+if __name__ == '__main__':
+    unittest.main()
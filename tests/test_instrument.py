@@ -0,0 +1,26 @@
+import unittest
+import instrument
+from instrument import Samples
+from text_buffer import TextBuffer
+
+class TestInstrument(unittest.TestCase):
+    def test_ring(self):
+        samples = Samples(3)
+        for i in range(5):
+            samples.add('op' + str(i), i, 0, 0)
+        self.assertEqual(len(samples), 3)
+        self.assertEqual([sample[0] for sample in samples], ['op2', 'op3', 'op4'])
+
+    def test_enable(self):
+        original = TextBuffer.insert_line
+        instrument.enable(size=8, command=False, femto=False)
+        b = TextBuffer()
+        b.insert_line(1, 'Hello')
+        b.delete_line(1)
+        instrument.disable()
+        b.insert_line(1, 'World')
+        self.assertEqual([sample[0] for sample in instrument.samples], ['buffer.insert_line', 'buffer.delete_line'])
+        self.assertTrue(TextBuffer.insert_line is original)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+import unittest
+from layout import Layout
+
+class TestLayout(unittest.TestCase):
+    def __init__(self):
+        self.layout = Layout(10)
+
+    def test_short(self):
+        self.assertEqual(self.layout.segments('hello'), ((0, 5),))
+
+    def test_word_wrap(self):
+        text = 'the quick brown fox'
+        self.assertEqual(self.layout.segments(text), ((0, 10), (10, 19)))
+        self.assertEqual(self.layout.locate(text, 11), (1, 1))
+        self.assertEqual(self.layout.locate(text, 20), (1, 10))
+
+    def test_hard_wrap(self):
+        text = '{"a":1,"b":2,"c":3}'
+        self.assertEqual(self.layout.segments(text), ((0, 10), (10, 19)))
+
+    def test_cache(self):
+        layout = Layout(10)
+        text = 'x' * 25
+        self.assertTrue(layout.segments(text) is layout.segments(text))
+        layout.set_width(20)
+        self.assertEqual(layout.rows(text), 2)
+
+    def test_truncate(self):
+        self.assertEqual(Layout(10, wrap=False).segments('x' * 25), ((0, 10),))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+import os
+from line_index import LineIndex
+
+tests_dir = __file__.rsplit('/', 1)[0] if '/' in __file__ else '.'
+
+class TestLineIndex(unittest.TestCase):
+    def __init__(self):
+        with open(tests_dir + '/lipsum.txt', 'rb') as f:
+            self.data = f.read()
+            self.index = LineIndex.build(f)
+
+    def tearDown(self):
+        try:
+            os.remove(tests_dir + '/lipsum.txt.idx')
+        except OSError:
+            pass
+
+    def test_offsets(self):
+        self.assertEqual(len(self.index), self.data.count(b'\n') + (0 if self.data.endswith(b'\n') else 1))
+        self.assertEqual(self.index.offsets[0], 0)
+        self.assertEqual(self.index.offsets[-1], len(self.data))
+
+    def test_span(self):
+        start, stop = self.index.span(1, 2)
+        self.assertEqual(self.data[start:stop], self.data.split(b'\n')[1] + b'\n')
+
+    def test_cache(self):
+        self.index.save(tests_dir + '/lipsum.txt')
+        cached = LineIndex.load(tests_dir + '/lipsum.txt')
+        self.assertEqual(list(cached.offsets), list(self.index.offsets))
+
+    def test_stale_cache(self):
+        self.assertEqual(LineIndex.load(tests_dir + '/no_such_file.txt'), None)
+
+if __name__ == '__main__':
+    unittest.main()
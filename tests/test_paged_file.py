@@ -0,0 +1,35 @@
+import unittest
+from paged_file import PagedFile
+from text_buffer import TextBuffer
+
+tests_dir = __file__.rsplit('/', 1)[0] if '/' in __file__ else '.'
+
+class TestPagedFile(unittest.TestCase):
+    def __init__(self):
+        self.p = PagedFile(tests_dir + '/lipsum.txt')
+        self.p.page_lines = 4  # small pages to exercise the cache
+        with open(tests_dir + '/lipsum.txt') as f:
+            self.lines = [line.rstrip('\r\n') for line in f]
+
+    def test_length(self):
+        self.assertEqual(len(self.p), len(self.lines))
+
+    def test_lines(self):
+        for i in range(len(self.lines)):
+            self.assertEqual(self.p[i], self.lines[i])
+
+    def test_page_cache(self):
+        self.p[len(self.lines) - 1]
+        self.p[0]
+        self.assertTrue(len(self.p._pages) <= self.p.max_pages)
+
+    def test_paged_text_buffer(self):
+        b = TextBuffer(paged=True)
+        b.verbose = False
+        b.load(tests_dir + '/lipsum.txt')
+        self.assertEqual(b.get_line(1), self.lines[0])
+        self.assertEqual(b.get_line(len(self.lines)), self.lines[-1])
+        b.purge()
+
+if __name__ == '__main__':
+    unittest.main()
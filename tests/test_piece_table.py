@@ -0,0 +1,54 @@
+import unittest
+from piece_table import PieceTable, TextSource
+from text_buffer import TextBuffer
+
+class TestPieceTable(unittest.TestCase):
+    def setUp(self):
+        self.p = PieceTable()
+        self.p.add_source(TextSource('one\ntwo\nthree\nfour\n'))
+
+    def test_source(self):
+        s = TextSource('alpha\r\nbeta\ngamma')
+        self.assertEqual(len(s), 3)
+        self.assertEqual(s[0], 'alpha')
+        self.assertEqual(s[2], 'gamma')
+        self.assertEqual(len(TextSource('')), 0)
+
+    def test_get(self):
+        self.assertEqual(len(self.p), 4)
+        self.assertEqual(self.p[0], 'one')
+        self.assertEqual(self.p[-1], 'four')
+        self.assertEqual(self.p[1:3], ['two', 'three'])
+
+    def test_insert(self):
+        self.p.insert(2, 'two and a half')
+        self.p.insert(3, 'two and three quarters')
+        self.assertEqual(self.p, ['one', 'two', 'two and a half', 'two and three quarters', 'three', 'four'])
+
+    def test_delete(self):
+        del self.p[1:3]
+        self.assertEqual(self.p, ['one', 'four'])
+        del self.p[0]
+        self.assertEqual(self.p, ['four'])
+
+    def test_set(self):
+        self.p[0] = 'uno'
+        self.p[1:2] = ['dos', 'tres']
+        self.assertEqual(self.p, ['uno', 'dos', 'tres', 'three', 'four'])
+
+    def test_copy_lines(self):
+        p = PieceTable(['one', 'two', 'three', 'four'])
+        p.copy_lines(0, 2, 4)
+        self.assertEqual(p, ['one', 'two', 'three', 'four', 'one', 'two'])
+
+    def test_text_buffer_storage(self):
+        b = TextBuffer(storage=PieceTable)
+        b.verbose = False
+        b._buffer.extend(['one', 'two', 'three', 'four', 'five', 'six', 'seven'])
+        b.move_range(3, 5, 6)
+        self.assertEqual(b._buffer, ['one', 'two', 'six', 'three', 'four', 'five', 'seven'])
+        b.purge()
+        self.assertEqual(len(b._buffer), 0)
+
+if __name__ == '__main__':
+    unittest.main()
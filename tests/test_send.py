@@ -0,0 +1,126 @@
+import unittest
+import os
+import sys
+import command
+from queue import Queue, Empty
+from threading import Thread
+
+tests_dir = __file__.rsplit('/', 1)[0] if '/' in __file__ else '.'
+sys.path.append(tests_dir + '/../tools')
+from send import Sender  # noqa: E402
+
+class Link:
+    """
+    A serial connection between Sender, which uses it as its port, and
+    recv(), which reads it through a Device.
+    """
+    def __init__(self, corrupt=()):
+        self.to_device = Queue()
+        self.to_host = Queue()
+        self.corrupt = corrupt  # numbers of the frames to damage
+        self.frames = 0
+
+    def write(self, data):
+        if data[:1].isdigit():
+            self.frames += 1
+            if self.frames in self.corrupt:
+                data = data[:-3] + (b'A' if data[-3:-2] != b'A' else b'B') + data[-2:]
+        for line in data.decode().splitlines(True):
+            self.to_device.put(line)
+
+    def readline(self):
+        try:
+            return self.to_host.get(timeout=5).encode()
+        except Empty:
+            return b''
+
+    def reset_input_buffer(self):
+        pass
+
+class Device:
+    """
+    The microcontroller end of a Link, standing in for stdin and print.
+    """
+    def __init__(self, link):
+        self.link = link
+
+    def readline(self):
+        line = self.link.to_device.get(timeout=5)
+        return '' if line is None else line
+
+    def print(self, *args):
+        self.link.to_host.put(' '.join(str(arg) for arg in args) + '\n')
+
+class TestSend(unittest.TestCase):
+    def __init__(self):
+        self.remote = tests_dir + '/recv_temp.bin'
+        self.data = bytes((n * 7) % 256 for n in range(3000))
+
+    def setUp(self):
+        self.link = Link()
+        device = Device(self.link)
+        self.stdin = command.stdin
+        command.stdin = device
+        command.print = device.print
+
+    def tearDown(self):
+        command.stdin = self.stdin
+        del command.print
+        if 'recv_temp.bin' in os.listdir(tests_dir):
+            os.remove(self.remote)
+
+    def transfer(self, resume=False):
+        results = []
+        device = Thread(target=lambda: results.append(command.recv(self.remote, binary=True, resume=resume)))
+        device.start()
+        sender = Sender(self.link, block_size=256, window=3)
+        word, offset = sender._read_reply()
+        self.assertEqual(word, 'RDY')
+        with open(tests_dir + '/send_temp.bin', 'wb') as f:
+            f.write(self.data)
+        try:
+            with open(tests_dir + '/send_temp.bin', 'rb') as f:
+                ok = sender.send(f, offset)
+        finally:
+            os.remove(tests_dir + '/send_temp.bin')
+        device.join(5)
+        with open(self.remote, 'rb') as f:
+            received = f.read()
+        return offset, ok, results, received
+
+    def test_round_trip(self):
+        offset, ok, results, received = self.transfer()
+        self.assertEqual((offset, ok, results), (0, True, [True]))
+        self.assertEqual(received, self.data)
+
+    def test_corrupt_block(self):
+        self.link.corrupt = (2, 5)
+        offset, ok, results, received = self.transfer()
+        self.assertEqual((ok, results), (True, [True]))
+        self.assertEqual(received, self.data)
+        self.assertTrue(self.link.frames > 12)  # The damaged blocks went again.
+
+    def test_resume(self):
+        with open(self.remote, 'wb') as f:
+            f.write(self.data[:1000])
+        offset, ok, results, received = self.transfer(resume=True)
+        self.assertEqual((offset, ok, results), (1000, True, [True]))
+        self.assertEqual(received, self.data)
+        self.assertEqual(self.link.frames, 8)  # Only the last 2000 bytes
+
+    def test_end_of_input(self):
+        self.link.to_device.put('0 00000000 AAAA\n')
+        self.link.to_device.put(None)
+        self.assertFalse(command.recv(self.remote, binary=True))
+        self.assertEqual(self.link.readline(), b'RDY 0\n')
+        self.assertEqual(self.link.readline(), b'NAK 0\n')
+        self.assertEqual(self.link.readline(), b'FAIL 0\n')
+
+    def test_bad_end(self):
+        self.link.to_device.put('END many 0\n')
+        self.assertFalse(command.recv(self.remote, binary=True))
+        self.assertEqual(self.link.readline(), b'RDY 0\n')
+        self.assertEqual(self.link.readline(), b'FAIL 0\n')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -36,6 +36,16 @@ class TestTextBuffer(unittest.TestCase):
         self.assertEqual(self.b._buffer[0], 'World')
         self.assertEqual(self.b._is_dirty, True)
 
+    def test_delete_first_line(self):
+        self.b._buffer = ['one', 'two']
+        self.b.journal.clear()
+        self.assertEqual(self.b.delete_line(1), True)
+        self.assertEqual(self.b._buffer, ['two'])
+        self.assertEqual(self.b.delete_line(0), False)
+        self.assertEqual(self.b._buffer, ['two'])
+        self.b.undo()
+        self.assertEqual(self.b._buffer, ['one', 'two'])
+
     def test_find_line(self):
         self.b._buffer = ['one', 'two', 'three', 'four', 'five', 'six']
         self.assertEqual(self.b.find_line('two'), 2)
@@ -50,6 +60,13 @@ class TestTextBuffer(unittest.TestCase):
         self.b._buffer = ['one', 'two', 'three', 'four', 'five', 'six']
         self.assertEqual(self.b.find_line('two', start=99), None)
 
+    def test_find_all(self):
+        self.b._buffer = ['one', 'two', 'three', 'four', 'five', 'six']
+        self.assertEqual(self.b.find_all('f'), [4, 5])
+        self.assertEqual(self.b.find_all('e', 2), [3, 5])
+        self.assertEqual(self.b.find_all('e', 1, 3), [1, 3])
+        self.assertEqual(self.b.find_all('^z'), [])
+
     def test_save(self):
         self.b.save('/tests/text_buffer_temp.txt')
         self.assertEqual(self.b._is_dirty, False)
@@ -87,5 +104,42 @@ class TestTextBuffer(unittest.TestCase):
         self.b.move_range(3, 5, 6)
         self.assertEqual(self.b._buffer, ['one', 'two', 'six', 'three', 'four', 'five', 'seven'])
 
+    def test_undo_redo(self):
+        self.b._buffer = ['one', 'two', 'three', 'four']
+        self.b.journal.clear()
+        self.b.update_line(2, 'TWO')
+        self.b.checkpoint()
+        self.b.move_range(3, 4, 0)
+        self.b.checkpoint()
+        self.assertEqual(self.b._buffer, ['three', 'four', 'one', 'TWO'])
+        self.assertEqual(self.b.undo(), 1)
+        self.assertEqual(self.b._buffer, ['one', 'TWO', 'three', 'four'])
+        self.b.undo()
+        self.assertEqual(self.b._buffer, ['one', 'two', 'three', 'four'])
+        self.assertEqual(self.b.undo(), None)
+        self.b.redo()
+        self.b.redo()
+        self.assertEqual(self.b._buffer, ['three', 'four', 'one', 'TWO'])
+
+    def test_undo_typing(self):
+        line = 'x' * 40
+        self.b._buffer = ['before', line, 'after']
+        self.b.journal.clear()
+        for n in range(1, 201):
+            self.b.update_line(2, line + 'y' * n)
+        self.b.update_line(3, 'AFTER')
+        self.b.update_line(2, 'done')
+        self.assertEqual(self.b.journal.can_undo(), True)
+        self.b.undo()
+        self.assertEqual(self.b._buffer, ['before', line, 'after'])
+        self.b.redo()
+        self.assertEqual(self.b._buffer, ['before', 'done', 'AFTER'])
+
+    def test_undo_limit(self):
+        self.b._buffer = ['x' * 100] * 100
+        self.b.journal.clear()
+        self.b.delete_range(1, 100)
+        self.assertEqual(self.b.journal.can_undo(), False)
+
 if __name__ == '__main__':
     unittest.main()
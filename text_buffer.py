@@ -1,17 +1,35 @@
+import os
 from sys import stdout
-from re import search
+from regex_cache import get_regex
+from piece_table import PieceTable, TextSource
+from paged_file import PagedFile
+from line_index import LineIndex
+from journal import Journal
 
 
 class TextBuffer:
     """
     Functions for loading, saving and manipulating text editor buffers.
     Lines start from 1 (not 0) to be consistent with editor numbering.
+    Storage can be a plain list (the default) or any list-like class,
+    such as PieceTable for large files. Paged buffers read lines from
+    the file on demand, so files can be larger than free RAM. Their line
+    index can be cached next to the file to skip the scan next time.
+    Changes are kept in a journal, so they can be undone and redone.
     """
 
-    def __init__(self, filename=None):
-        self._buffer = []
+    write_size = 512  # bytes buffered before each write to flash
+    undo_size = 4096  # bytes of undo history kept before the oldest goes
+
+    def __init__(self, filename=None, storage=list, paged=False, cache_index=False):
+        self._storage = storage
+        self._buffer = storage()
         self._is_dirty = False
         self.verbose = True
+        self.paged = paged
+        self.cache_index = cache_index
+        self.journal = Journal(self.undo_size)
+        self._mark_lists = []
         self.filename = filename
         if filename is not None:
             self.load(filename)
@@ -24,7 +42,8 @@ class TextBuffer:
         Purge the line in the buffer indicated by the line number.
         """
         buffer_index = line_num - 1
-        if buffer_index > 0 and buffer_index < len(self._buffer):
+        if buffer_index >= 0 and buffer_index < len(self._buffer):
+            self._changed(Journal.DELETE, line_num, 1, [self._buffer[buffer_index]])
             del self._buffer[buffer_index]
             self._is_dirty = True
             return True
@@ -41,19 +60,44 @@ class TextBuffer:
         else:
             return None
 
+    def get_lines(self, start, stop):
+        """
+        Iterate over lines start..stop, reading them in ranges when the
+        storage allows it.
+        """
+        if isinstance(self._buffer, PieceTable):
+            return self._buffer.lines(start - 1, stop)
+        return iter(self._buffer[start - 1 : stop])
+
+    def find_iter(self, expr, start=1, stop=None):
+        """
+        Yield the number of each line from start..stop that contains expr.
+        The expression is compiled once for the whole search.
+        """
+        regex = get_regex(expr)
+        start = max(start, 1)
+        if stop is None:
+            stop = len(self._buffer)
+        line_num = start
+        for line in self.get_lines(start, stop):
+            if regex.search(line) is not None:
+                yield line_num
+            line_num += 1
+
+    def find_all(self, expr, start=1, stop=None):
+        """
+        Return a list of all line numbers from start..stop containing expr.
+        """
+        return list(self.find_iter(expr, start, stop))
+
     def find_line(self, expr, start=1):
         """
         Return the first line number (from start) that contains expr.
         Return None if not found.
         """
-        found = None
-        line_num = None  # in case start > buffer length
-        for line_num in range(start, len(self._buffer) + 1):
-            line = self.get_line(line_num)
-            found = search(expr, line)
-            if found is not None:
-                break
-        return line_num if (found is not None) else None
+        for line_num in self.find_iter(expr, start):
+            return line_num
+        return None
 
     def insert_line(self, line_num, text):
         """
@@ -62,15 +106,38 @@ class TextBuffer:
         """
         if line_num < 1:
             return False
-        buffer_index = line_num - 1
+        buffer_index = min(line_num - 1, len(self._buffer))
         self._buffer.insert(buffer_index, text.rstrip("\r\n"))
+        self._changed(Journal.INSERT, buffer_index + 1, 1)
         self._is_dirty = True
 
+    def insert_lines(self, line_num, lines):
+        """
+        Add lines from any iterable at the indicated line number, as one
+        change. Returns how many lines were added.
+        """
+        if line_num < 1:
+            return False
+        buffer_index = min(line_num - 1, len(self._buffer))
+        length = len(self._buffer)
+        lines = (line.rstrip("\r\n") for line in lines)
+        if isinstance(self._buffer, PieceTable):
+            self._buffer[buffer_index:buffer_index] = lines
+        else:
+            self._buffer[buffer_index:buffer_index] = list(lines)
+        count = len(self._buffer) - length
+        if count > 0:
+            self._changed(Journal.INSERT, buffer_index + 1, count)
+            self._is_dirty = True
+        return count
+
     def update_line(self, line_num, text):
         """
         Replace the line indicated by the line number with new text.
         """
         buffer_index = line_num - 1
+        old_line = self._buffer[buffer_index]
+        self._changed(Journal.REPLACE, line_num, 1, [old_line])
         self._buffer[buffer_index] = text.rstrip("\r\n")
         self._is_dirty = True
 
@@ -78,15 +145,32 @@ class TextBuffer:
         """
         Copy lines start..stop after line given by dest.
         """
-        self._buffer[dest:dest] = self._buffer[start - 1 : stop]
+        if isinstance(self._buffer, PieceTable):
+            self._buffer.copy_lines(start - 1, stop, dest)
+        else:
+            self._buffer[dest:dest] = self._buffer[start - 1 : stop]
+        self._changed(Journal.INSERT, dest + 1, stop - start + 1)
         self._is_dirty = True
 
     def delete_range(self, start, stop):
         """
         Remove the lines from start..stop.
         """
+        removed = []
+        size = 0
+        for line in self.get_lines(start, stop):  # Stop reading once too big.
+            size += len(line)
+            if size > self.journal.max_bytes:
+                removed = None
+                break
+            removed.append(line)
         del self._buffer[start - 1 : stop]
-        self.is_dirty = True
+        if removed is None:
+            self.journal.drop()
+            self._move_marks(Journal.DELETE, start, stop - start + 1)
+        else:
+            self._changed(Journal.DELETE, start, len(removed), removed)
+        self._is_dirty = True
 
     def move_range(self, start, stop, dest):
         """
@@ -95,7 +179,62 @@ class TextBuffer:
         self.copy_range(start, stop, dest)
         offset = stop - start + 1 if (dest < start) else 0
         self.delete_range(start + offset, stop + offset)
-        self.is_dirty = True
+
+    def _move_marks(self, op, start, count):
+        for marks in self._mark_lists:
+            marks.shift(op, start, count)
+
+    def _changed(self, op, start, count, lines=None):
+        """
+        Record a change in the journal and keep marks on their lines.
+        """
+        self.journal.record(op, start, count, lines)
+        self._move_marks(op, start, count)
+
+    def _reverse(self, record):
+        """
+        Undo one journal record and return the record that undoes that.
+        """
+        op, start, count, lines = record
+        if op == Journal.DELETE:
+            self._buffer[start - 1 : start - 1] = lines
+            reverse = (Journal.INSERT, start, count, None)
+        else:
+            old_lines = list(self.get_lines(start, start + count - 1))
+            if op == Journal.INSERT:
+                del self._buffer[start - 1 : start - 1 + count]
+                reverse = (Journal.DELETE, start, count, old_lines)
+            else:
+                self._buffer[start - 1 : start - 1 + count] = lines
+                reverse = (Journal.REPLACE, start, count, old_lines)
+        self._move_marks(reverse[0], reverse[1], reverse[2])
+        self._is_dirty = True
+        return reverse
+
+    def _first_line(self, records):
+        if records is None:
+            return None
+        return min(record[1] for record in records)
+
+    def checkpoint(self):
+        """
+        Mark the end of an edit. Everything changed since the last
+        checkpoint is undone in one go.
+        """
+        self.journal.checkpoint()
+
+    def undo(self):
+        """
+        Reverse the most recent edit. Return the first line it touched,
+        or None if there was nothing to undo.
+        """
+        return self._first_line(self.journal.undo(self._reverse))
+
+    def redo(self):
+        """
+        Put back the most recently undone edit.
+        """
+        return self._first_line(self.journal.redo(self._reverse))
 
     def _read_file_line(self, file_handle):
         """
@@ -112,11 +251,21 @@ class TextBuffer:
     def load(self, filename):
         """
         Read file contents into buffer while stripping end of line characters.
+        When paged, only an index of line positions is read up front.
         """
         try:
-            with open(filename, "r") as f:
-                for line in self._read_file_line(f):
-                    self._buffer.append(line.rstrip("\r\n"))
+            if self.paged is True:
+                if not isinstance(self._buffer, PieceTable):
+                    self._buffer = PieceTable(self._buffer)
+                source = PagedFile(filename, cache_index=self.cache_index)
+                self._buffer.add_source(source)
+            else:
+                with open(filename, "r") as f:
+                    if isinstance(self._buffer, PieceTable):
+                        self._buffer.add_source(TextSource(f.read()))
+                    else:
+                        for line in self._read_file_line(f):
+                            self._buffer.append(line.rstrip("\r\n"))
         except Exception as ex:
             if self.verbose is True:
                 stdout.write("{}: {}\n".format(filename, ex))
@@ -124,22 +273,103 @@ class TextBuffer:
         else:
             self.filename = filename
             self._is_dirty = False
+            self.journal.clear()
             if self.verbose is True:
                 stdout.write(
                     "{:d} lines read from {:s}\n".format(len(self._buffer), filename)
                 )
             return True
 
+    def _write_lines(self, file, lines, eol_marker, position=0, index=None):
+        """
+        Write lines through a fixed size buffer, so flash sees a few large
+        writes instead of one small write per line. When an index is given,
+        the file position at the end of each line is recorded in it.
+        """
+        buffer = bytearray(self.write_size)
+        view = memoryview(buffer)
+        eol = eol_marker.encode()
+        fill = 0
+        for line in lines:
+            for data in (line.encode(), eol):
+                size = len(data)
+                if fill + size > len(buffer):
+                    file.write(view[:fill])
+                    fill = 0
+                if size > len(buffer):  # too big to buffer, so write it as is
+                    file.write(data)
+                else:
+                    view[fill : fill + size] = data
+                    fill += size
+                position += size
+            if index is not None:
+                index.append(position)
+        if fill > 0:
+            file.write(view[:fill])
+
+    def _appendable_source(self, filename, eol_marker):
+        """
+        Return the paged source for filename when the buffer holds all of
+        its lines unchanged followed only by new lines, otherwise None.
+        """
+        source = self._buffer.prefix_source()
+        if getattr(source, "filename", None) != filename:
+            return None
+        if source.ends_with(eol_marker) is False:
+            return None
+        if os.stat(filename)[6] != source.index.offsets[-1]:  # changed on flash
+            return None
+        return source
+
+    def _replace_file(self, temp_filename, filename):
+        """
+        Rename the fully written temporary file over the original.
+        """
+        if hasattr(os, "sync"):
+            os.sync()
+        try:
+            os.rename(temp_filename, filename)
+        except OSError:  # Some file systems will not rename over a file.
+            os.remove(filename)
+            os.rename(temp_filename, filename)
+
     def save(self, filename=None, eol_marker="\n"):
         """
         Write contents of buffer to filename by adding end of line character(s).
+        Contents go to a temporary file that replaces the original only after
+        it is completely written, so a power loss cannot leave a half-written
+        file. When lines were only added to the end of an unchanged paged
+        file, just the new lines are appended. A paged buffer is reopened on
+        the new file using the line index recorded while writing.
         """
         if filename is None:
             filename = self.filename
+        paged = isinstance(self._buffer, PieceTable) and self._buffer.uses_file(
+            filename
+        )
         try:
-            with open(filename, "w") as f:
-                for line in self._buffer:
-                    f.write(line + eol_marker)
+            source = self._appendable_source(filename, eol_marker) if paged else None
+            if source is not None:
+                index = source.index
+                with open(filename, "ab") as f:
+                    new_lines = self._buffer.lines(len(source), len(self._buffer))
+                    self._write_lines(
+                        f, new_lines, eol_marker, index.offsets[-1], index
+                    )
+            else:
+                index = LineIndex() if paged else None
+                temp_filename = filename + ".tmp"
+                with open(temp_filename, "wb") as f:
+                    self._write_lines(f, self._buffer, eol_marker, 0, index)
+            if paged is True:
+                self._buffer.close()
+            if source is None:
+                self._replace_file(temp_filename, filename)
+            if paged is True:
+                if self.cache_index is True:
+                    index.save(filename)
+                self._buffer = PieceTable()
+                self._buffer.add_source(PagedFile(filename, index))
         except Exception as ex:
             if self.verbose is True:
                 stdout.write("{}: {}\n".format(filename, ex))
@@ -157,7 +387,10 @@ class TextBuffer:
         """
         Release the buffer list object and start with a fresh one.
         """
+        if isinstance(self._buffer, PieceTable):
+            self._buffer.close()
         del self._buffer
-        self._buffer = []
+        self._buffer = self._storage()
         self.filename = None
         self._is_dirty = False
+        self.journal.clear()
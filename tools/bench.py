@@ -0,0 +1,303 @@
+"""
+Benchmarks for TextBuffer, the Atto parser, grep() and Femto screen
+updates. Runs on CPython and on the MicroPython unix port, so results
+from a PC and from the port a board uses can be tracked side by side.
+
+Usage:
+    python tools/bench.py [--lines 1000,10000] [--storage list|piece|paged]
+                          [--ops 100] [--dir DIR] [--output FILE]
+    micropython tools/bench.py ...
+
+Synthetic files are made from a fixed word list with a fixed seed, so
+every run works on exactly the same text. The last line of each file
+is the only one containing 'needle', which makes searches scan the
+whole file.
+
+Results are printed as one line of JSON (and written to --output if
+given) for comparing runs over time. Times are in microseconds. Memory
+is the traced peak on CPython. MicroPython has no peak counter, so there
+it's the bytes allocated while the garbage collector is held off, which
+is never less than the real peak.
+"""
+
+import gc
+import json
+import os
+import sys
+
+try:
+    from time import ticks_us, ticks_diff
+except ImportError:
+    from time import perf_counter
+
+    def ticks_us():
+        return int(perf_counter() * 1000000)
+
+    def ticks_diff(end, start):
+        return end - start
+
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+_tools_dir = __file__.replace("\\", "/").rsplit("/", 1)[0] if "/" in __file__ else "."
+sys.path.insert(0, _tools_dir + "/..")
+
+from ansi import ANSI, Cursor, Output, Screen  # noqa: E402
+from atto import Atto  # noqa: E402
+from command import grep  # noqa: E402
+from femto import Femto, Viewport  # noqa: E402
+from piece_table import PieceTable  # noqa: E402
+from text_buffer import TextBuffer  # noqa: E402
+
+words = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod"
+    " tempor incididunt ut labore et dolore magna aliqua def return import"
+    " self print while for if else 0 1 42 = == ( ) :"
+).split()
+
+parse_commands = ("p", "1,$p", "%n", ".,$d", ">", "12,40s/a/b/g", "$a", "w out.txt")
+
+
+def make_file(filename, lines, seed=1):
+    """
+    Write a file of pseudo-random lines, the same every time for a given
+    seed, ending with the one line that contains 'needle'.
+    """
+    buffer = []
+    with open(filename, "w") as f:
+        for _ in range(lines - 1):
+            seed = (seed * 1103515245 + 12345) & 0x7FFFFFFF
+            count = 4 + seed % 9
+            line = []
+            for _ in range(count):
+                seed = (seed * 1103515245 + 12345) & 0x7FFFFFFF
+                line.append(words[(seed >> 8) % len(words)])
+            buffer.append(" ".join(line))
+            if len(buffer) == 256:
+                f.write("\n".join(buffer) + "\n")
+                buffer = []
+        buffer.append("a needle in a haystack")
+        f.write("\n".join(buffer) + "\n")
+    return os.stat(filename)[6]
+
+
+def timed(fn):
+    """
+    Return (result, microseconds) for one call of fn.
+    """
+    start = ticks_us()
+    result = fn()
+    return result, ticks_diff(ticks_us(), start)
+
+
+def measured(fn):
+    """
+    Return (result, peak bytes, bytes still held) for one call of fn.
+    """
+    gc.collect()
+    if tracemalloc is not None:
+        tracemalloc.start()
+        result = fn()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return result, peak, current
+    before = gc.mem_alloc()
+    gc.disable()
+    try:
+        result = fn()
+        peak = gc.mem_alloc() - before
+    finally:
+        gc.enable()
+    gc.collect()
+    return result, peak, gc.mem_alloc() - before
+
+
+def rate(size, elapsed_us):
+    return int(size * 1000000 / elapsed_us) if elapsed_us > 0 else None
+
+
+def new_buffer(storage):
+    if storage == "paged":
+        buffer = TextBuffer(paged=True)
+    elif storage == "piece":
+        buffer = TextBuffer(storage=PieceTable)
+    else:
+        buffer = TextBuffer()
+    buffer.verbose = False
+    return buffer
+
+
+def load(filename, storage):
+    buffer = new_buffer(storage)
+    buffer.load(filename)
+    return buffer
+
+
+def edit_latency(buffer, ops):
+    """
+    Average microseconds to insert, then delete, a line at the head,
+    middle and tail of the buffer. The buffer ends up as it started.
+    """
+    results = {}
+    length = len(buffer._buffer)
+    for where, line_num in (("head", 1), ("middle", length // 2), ("tail", length + 1)):
+        line_num = max(line_num, 1)
+        _, insert_us = timed(
+            lambda: [buffer.insert_line(line_num, "inserted line") for _ in range(ops)]
+        )
+        _, delete_us = timed(
+            lambda: [buffer.delete_line(line_num) for _ in range(ops)]
+        )
+        buffer.checkpoint()
+        results[where] = {"insert_us": insert_us / ops, "delete_us": delete_us / ops}
+    return results
+
+
+def parse_latency(buffer, ops):
+    """
+    Average microseconds for Atto.parse() on ordinary commands, and for
+    a /regex/ address that has to search the whole buffer.
+    """
+    editor = Atto()
+    editor.verbose = False
+    editor._buffer = buffer._buffer
+    editor._current_line = 1
+    _, plain_us = timed(
+        lambda: [editor.parse(cmd) for _ in range(ops) for cmd in parse_commands]
+    )
+    _, search_us = timed(lambda: editor.parse("/needle/p"))
+    return plain_us / (ops * len(parse_commands)), search_us
+
+
+class _ByteCounter:
+    def __init__(self):
+        self.count = 0
+
+    def write(self, data):
+        self.count += len(data)
+
+
+def frame_bytes(buffer, lines=24, cols=80):
+    """
+    Count the bytes Femto sends to an 80x24 terminal for a full redraw,
+    a redraw with nothing changed, a one line scroll, a page down, a
+    typed character and a new line.
+    """
+    counter = _ByteCounter()
+    terminal = ANSI.__new__(ANSI)  # Skips reset(), which needs a real terminal.
+    terminal.output = Output()
+    terminal.output._raw = counter
+    terminal.cursor = Cursor(terminal.output)
+    terminal.lines = terminal.cursor.lines = lines
+    terminal.cols = terminal.cursor.cols = cols
+
+    editor = Femto()
+    editor.verbose = False
+    editor._buffer = buffer._buffer
+    editor.filename = "bench.txt"
+    editor.terminal = terminal
+    editor.screen = Screen(terminal)
+    top_row, bottom_row = editor._text_rows()
+    editor.view = Viewport(top_row, bottom_row, cols)
+    editor.layout = None
+    editor._ctrl_key_functions = {}
+    with terminal.frame():
+        terminal.scroll_region = (top_row, bottom_row)
+
+    results = {}
+    for name, update in (
+        ("full", lambda: editor._refresh_screen(full=True)),
+        ("unchanged", lambda: editor._refresh_screen()),
+        ("scroll", lambda: editor._scroll(1)),
+        ("page", lambda: editor.screen_scroll(ANSI.KEY_NPAGE)),
+        ("key", lambda: editor._handle_key(ord("x"))),
+        ("enter", lambda: editor._handle_key(ANSI.KEY_ENTER)),
+    ):
+        counter.count = 0
+        with terminal.frame():
+            update()
+        results[name] = counter.count
+    return results
+
+
+def bench(lines, storage, ops, directory):
+    filename = directory + "/bench_{:d}.txt".format(lines)
+    out_filename = directory + "/bench_out.txt"
+    size = make_file(filename, lines)
+    result = {"lines": lines, "file_bytes": size}
+
+    buffer, load_us = timed(lambda: load(filename, storage))
+    del buffer
+    buffer, peak, held = measured(lambda: load(filename, storage))
+    result["load"] = {
+        "us": load_us,
+        "bytes_per_s": rate(size, load_us),
+        "peak_bytes": peak,
+        "held_bytes": held,
+    }
+
+    _, save_us = timed(lambda: buffer.save(out_filename))
+    _, peak, _ = measured(lambda: buffer.save(out_filename))
+    result["save"] = {
+        "us": save_us,
+        "bytes_per_s": rate(size, save_us),
+        "peak_bytes": peak,
+    }
+
+    result["edit"] = edit_latency(buffer, ops)
+    _, result["find_line_us"] = timed(lambda: buffer.find_line("needle"))
+    _, result["grep_us"] = timed(lambda: list(grep("needle", filename, pipe=True)))
+    result["parse_us"], result["parse_search_us"] = parse_latency(buffer, ops)
+    result["frame_bytes"] = frame_bytes(buffer)
+
+    del buffer
+    for name in (filename, out_filename, filename + ".idx"):
+        try:
+            os.remove(name)
+        except OSError:
+            pass
+    return result
+
+
+def main(argv):
+    options = {
+        "--lines": "1000,10000,100000",
+        "--storage": "list",
+        "--ops": "100",
+        "--dir": ".",
+        "--output": None,
+    }
+    args = argv[1:]
+    while args:
+        name = args.pop(0)
+        if name not in options or not args:
+            print(__doc__)
+            return 1
+        options[name] = args.pop(0)
+
+    report = {
+        "implementation": sys.implementation.name,
+        "version": sys.version,
+        "platform": sys.platform,
+        "storage": options["--storage"],
+        "results": [],
+    }
+    for lines in options["--lines"].split(","):
+        report["results"].append(
+            bench(int(lines), options["--storage"], int(options["--ops"]), options["--dir"])
+        )
+        gc.collect()
+
+    text = json.dumps(report)
+    print(text)
+    if options["--output"] is not None:
+        with open(options["--output"], "w") as f:
+            f.write(text + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,137 @@
+"""
+Send a file to a microcontroller running REPL Buddy, over the serial
+REPL connection. Runs on the host computer, not the microcontroller.
+
+Usage:
+    python send.py PORT LOCAL_FILE [REMOTE_FILE] [--resume]
+
+The file goes in base64 blocks, each with its own CRC32. A few blocks
+are kept in flight at once, and any block that arrives damaged is sent
+again. With --resume, whatever part of the file is already on the
+microcontroller is kept and only the rest is sent.
+
+Needs pyserial (pip install pyserial).
+"""
+
+import argparse
+import sys
+from binascii import b2a_base64, crc32
+
+
+class Sender:
+    def __init__(self, port, block_size=512, window=4):
+        self.port = port
+        self.block_size = block_size
+        self.window = window
+
+    def _read_reply(self):
+        """
+        Return the next (word, number) reply, skipping REPL echo and
+        anything else that isn't a reply.
+        """
+        while True:
+            line = self.port.readline()
+            if not line:
+                raise TimeoutError("No reply from microcontroller.")
+            fields = line.decode(errors="replace").split()
+            if len(fields) == 2 and fields[0] in ("RDY", "OK", "NAK", "DONE", "FAIL"):
+                return fields[0], int(fields[1])
+
+    def _drain(self):
+        """
+        Throw away replies still on their way after a timeout.
+        """
+        self.port.reset_input_buffer()
+        while self.port.readline():
+            pass
+
+    def start(self, remote_name, resume):
+        """
+        Get to a REPL prompt and start recv() on the microcontroller.
+        Return the offset it wants the file to start from.
+        """
+        self.port.write(b"\r\x03\x03")  # Ctrl-C out of anything running.
+        self.port.write(b"from command import recv\r")
+        command = "recv({!r}, binary=True, resume={})\r".format(remote_name, resume)
+        self.port.write(command.encode())
+        word, offset = self._read_reply()
+        if word != "RDY":
+            raise RuntimeError("Unexpected reply: {} {}".format(word, offset))
+        return offset
+
+    def send(self, file, offset):
+        """
+        Send the file from offset to the end, keeping up to window
+        blocks in flight.
+        """
+        file.seek(0, 2)
+        size = file.tell()
+        acked = offset
+        position = offset
+        in_flight = 0
+        skip = 0  # replies to ignore, for blocks sent before a rewind
+        while acked < size:
+            while in_flight < self.window and position < size:
+                file.seek(position)
+                data = file.read(self.block_size)
+                frame = "{:d} {:08x} ".format(position, crc32(data) & 0xFFFFFFFF)
+                self.port.write(frame.encode() + b2a_base64(data))
+                position += len(data)
+                in_flight += 1
+            try:
+                word, next_offset = self._read_reply()
+            except TimeoutError:
+                self._drain()
+                position = acked
+                in_flight = skip = 0
+                continue
+            in_flight -= 1
+            if skip > 0:
+                skip -= 1
+            elif word == "OK":
+                acked = next_offset
+                sys.stderr.write("\r{:d} of {:d} bytes".format(acked, size))
+            elif word == "NAK":
+                position = acked = next_offset
+                skip = in_flight  # They were sent after the bad block.
+            else:
+                raise RuntimeError("Transfer failed at {:d}.".format(next_offset))
+        sys.stderr.write("\n")
+
+        file.seek(0)
+        crc = 0
+        for data in iter(lambda: file.read(self.block_size), b""):
+            crc = crc32(data, crc)
+        self.port.write("END {:d} {:08x}\n".format(size, crc & 0xFFFFFFFF).encode())
+        word, total = self._read_reply()
+        return word == "DONE" and total == size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send a file to REPL Buddy.")
+    parser.add_argument("port", help="serial port, like /dev/ttyUSB0 or COM3")
+    parser.add_argument("local", help="file to send")
+    parser.add_argument("remote", nargs="?", help="name on the microcontroller")
+    parser.add_argument("--resume", action="store_true", help="keep what's there")
+    parser.add_argument("--baud", type=int, default=115200)
+    parser.add_argument("--block", type=int, default=512, help="bytes per block")
+    parser.add_argument("--window", type=int, default=4, help="blocks in flight")
+    args = parser.parse_args()
+
+    try:
+        import serial
+    except ImportError:
+        sys.exit("pyserial is needed: pip install pyserial")
+
+    remote = args.remote or args.local.replace("\\", "/").split("/")[-1]
+    with serial.Serial(args.port, args.baud, timeout=5) as port:
+        sender = Sender(port, args.block, args.window)
+        offset = sender.start(remote, args.resume)
+        with open(args.local, "rb") as file:
+            ok = sender.send(file, offset)
+    print("Sent." if ok else "Transfer failed.")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()